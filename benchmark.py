@@ -0,0 +1,256 @@
+import os
+import sys
+import time
+import tracemalloc
+from greenery import fsm
+from greenery.lego import parse, classes
+
+# Benchmarks for greenery, run against the regexes in `rfc5322/`.
+# E.g. `python benchmark.py reduce rfc5322/domain-literal.txt`
+
+def timed(function, *args, **kwargs):
+	'''Call the function, return its result and the time taken in seconds'''
+	start = time.perf_counter()
+	result = function(*args, **kwargs)
+	return result, time.perf_counter() - start
+
+def load(path):
+	with open(path) as file:
+		return parse(file.read().strip())
+
+def pieces(piece):
+	'''Generate every lego piece nested inside this one, including itself'''
+	yield piece
+	if hasattr(piece, "concs"):
+		for c in piece.concs:
+			yield from pieces(c)
+	if hasattr(piece, "mults"):
+		for m in piece.mults:
+			yield from pieces(m)
+	if hasattr(piece, "multiplicand"):
+		yield from pieces(piece.multiplicand)
+
+def bench_reduce(paths):
+	'''
+		Compare Hopcroft, Brzozowski and NumPy minimisation, and Hopcroft
+		minimisation of the same FSM kept in a `table`. The inputs are the
+		reversals of the FSMs of every distinct sub-expression of the supplied
+		regexes: `reversed()` is a subset construction, so these are realistic
+		unminimised `crawl()` outputs of many sizes.
+	'''
+	machines = {}
+	for path in paths:
+		regex = load(path)
+		alphabet = regex.alphabet()
+		for piece in pieces(regex):
+			if str(piece) not in machines and not piece.empty():
+				machines[str(piece)] = reversed(piece.to_fsm(alphabet))
+
+	rows = []
+	for machine in machines.values():
+		hopcroft, hopcroft_time = timed(machine.reduce, method="hopcroft")
+		brzozowski, brzozowski_time = timed(machine.reduce, method="brzozowski")
+		numpy, numpy_time = timed(machine.reduce, method="numpy")
+		dense = fsm.fsm.from_dense(machine.to_dense())
+		table, table_time = timed(dense.reduce)
+		assert hopcroft.map == brzozowski.map == numpy.map == table.map
+		rows.append((len(machine.states), len(hopcroft.states), hopcroft_time, brzozowski_time, numpy_time, table_time))
+	rows.sort()
+
+	print("states  minimal  hopcroft (ms)  brzozowski (ms)  numpy (ms)  table (ms)")
+	for (states, minimal, hopcroft_time, brzozowski_time, numpy_time, table_time) in rows:
+		print("{0:>6}  {1:>7}  {2:>13.3f}  {3:>15.3f}  {4:>10.3f}  {5:>10.3f}".format(
+			states, minimal, hopcroft_time * 1000, brzozowski_time * 1000, numpy_time * 1000, table_time * 1000
+		))
+
+	# The crossover is the smallest input size above which Hopcroft always wins
+	crossover = None
+	for (states, minimal, hopcroft_time, brzozowski_time, numpy_time, table_time) in reversed(rows):
+		if hopcroft_time > brzozowski_time:
+			break
+		crossover = states
+	print("Hopcroft is faster for every input of {0} states or more".format(crossover))
+
+def bench_to_fsm(paths, repeat=3):
+	'''
+		Time `parse(...).to_fsm()` end to end, best of `repeat` runs, for each of
+		the supplied regexes.
+	'''
+	print("regex                           states  to_fsm (s)")
+	for path in paths:
+		regex = load(path)
+		best = None
+		for i in range(repeat):
+			machine, elapsed = timed(regex.to_fsm)
+			if best is None or elapsed < best:
+				best = elapsed
+		print("{0:<30}  {1:>6}  {2:>10.3f}".format(path, len(machine.states), best))
+
+def peak_memory(function, *args, **kwargs):
+	'''Call the function, return the peak memory it allocated in bytes'''
+	tracemalloc.start()
+	try:
+		function(*args, **kwargs)
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+def chain(children, operation, reduce):
+	'''
+		Combine the FSMs left to right with `operation`, the way `conc.to_fsm()`
+		and `pattern.to_fsm()` do. Either reduce every intermediate result, or only
+		the final one.
+	'''
+	result = children[0]
+	for child in children[1:]:
+		result = operation(result, child, reduce=reduce)
+	return result.reduce()
+
+def bench_pipeline(paths):
+	'''
+		Compare eager minimisation (after every operation) with deferred
+		minimisation (once, at the end) for the chains of concatenations and
+		unions in every conc and pattern of the supplied regexes, in total time
+		and in peak memory.
+	'''
+	for path in paths:
+		regex = load(path)
+		alphabet = regex.alphabet()
+		chains = []
+		seen = set()
+		for piece in pieces(regex):
+			if str(piece) in seen:
+				continue
+			seen.add(str(piece))
+			if len(getattr(piece, "mults", ())) > 1:
+				children = [m.to_fsm(alphabet) for m in piece.mults]
+				chains.append((children, fsm.fsm.concatenate))
+			if len(getattr(piece, "concs", ())) > 1:
+				children = [c.to_fsm(alphabet) for c in piece.concs]
+				chains.append((children, fsm.fsm.union))
+
+		totals = {}
+		for reduce in [True, False]:
+			elapsed = 0
+			peak = 0
+			for (children, operation) in chains:
+				result, t = timed(chain, children, operation, reduce)
+				elapsed += t
+				peak = max(peak, peak_memory(chain, children, operation, reduce))
+			totals[reduce] = (elapsed, peak)
+
+		print(path + ": " + str(len(chains)) + " chains")
+		print("  mode      total (s)  peak memory (KiB)")
+		for (reduce, mode) in [(True, "eager"), (False, "deferred")]:
+			(elapsed, peak) = totals[reduce]
+			print("  {0:<8}  {1:>9.3f}  {2:>17.0f}".format(mode, elapsed, peak / 1024))
+
+def bench_classes(paths, repeat=3):
+	'''
+		Compare building each regex's FSM, and intersecting it with itself, over
+		the full alphabet and over one representative of each class of
+		characters, as `lego.classes()` computes them.
+	'''
+	print("regex                           symbols  classes  full (s)  classes (s)")
+	for path in paths:
+		regex = load(path)
+		symbols = classes(regex)
+		times = []
+		for alphabet in [regex.alphabet(), set(symbols.values())]:
+			best = None
+			for i in range(repeat):
+				machine, elapsed = timed(lambda: regex._to_fsm(alphabet) & regex._to_fsm(alphabet))
+				if best is None or elapsed < best:
+					best = elapsed
+			times.append(best)
+		print("{0:<30}  {1:>7}  {2:>7}  {3:>8.3f}  {4:>11.3f}".format(
+			path, len(symbols), len(set(symbols.values())), times[0], times[1]
+		))
+
+def bench_product(paths, lengths=(5000, 10000, 20000, 40000)):
+	'''
+		Compare intersecting each regex's FSM with its own reversal, stored as
+		dicts and, using NumPy if it's available, as dense tables, both without
+		reducing the product and with the default `reduce=True`. Then do the same
+		for chains of `lengths` states intersected with themselves, whose
+		products are as many breadth-first levels deep, each one state wide.
+	'''
+	print("                                               reduce=False          reduce=True")
+	print("regex                           states  product  dicts (s)  tables (s)  dicts (s)  tables (s)")
+	pairs = []
+	for path in paths:
+		machine = load(path).to_fsm()
+		pairs.append((path, machine, reversed(machine).reduce()))
+	for length in lengths:
+		chain = fsm.fsm(
+			alphabet = {"a"},
+			states   = range(length + 1),
+			initial  = 0,
+			finals   = {length},
+			map      = dict((i, {"a": i + 1}) for i in range(length)),
+		)
+		pairs.append(("chain of " + str(length), chain, chain))
+	for (name, machine, other) in pairs:
+		dense = [fsm.fsm.from_dense(f.to_dense()) for f in (machine, other)]
+		times = []
+		for reduce in [False, True]:
+			product, dicts_time = timed(machine.intersection, other, reduce=reduce)
+			result, tables_time = timed(dense[0].intersection, dense[1], reduce=reduce)
+			assert result == product
+			times.extend([dicts_time, tables_time])
+			if not reduce:
+				size = len(product.states)
+		print("{0:<30}  {1:>6}  {2:>7}  {3:>9.3f}  {4:>10.3f}  {5:>9.3f}  {6:>10.3f}".format(
+			name, len(machine.states), size, *times
+		))
+
+def bench_workers(paths, counts=(1, 2, 4, 8)):
+	'''
+		Time a large product with `crawl()` spread across different numbers of
+		worker processes: for each regex's FSM m, whose reversal is r, intersect
+		(m|r)* with rmr. The states are numbered identically every time. Each
+		pool of processes is started before it's timed, since it's reused from
+		one crawl to the next. Merging the results is serial, so any speed-up
+		depends on there being spare cores and on `follow()` costing more than
+		sending its states between processes.
+	'''
+	print("{0} cores".format(os.cpu_count()))
+	print("regex                           product  " + "  ".join(
+		"{0:>2} worker(s) (s)".format(count) for count in counts
+	))
+	for path in paths:
+		machine = load(path).to_fsm()
+		reverse = reversed(machine).reduce()
+		x = (machine | reverse).star()
+		y = reverse + machine + reverse
+		times = []
+		expected = None
+		for count in counts:
+			previous = fsm.use_workers(count)
+			try:
+				x.intersection(y, reduce=False)
+				product, elapsed = timed(x.intersection, y, reduce=False)
+			finally:
+				fsm.use_workers(previous)
+			if expected is None:
+				expected = product
+			assert product.map == expected.map
+			times.append(elapsed)
+		print("{0:<30}  {1:>7}  ".format(path, len(expected.states)) + "  ".join(
+			"{0:>16.3f}".format(elapsed) for elapsed in times
+		))
+
+benchmarks = {
+	"classes": bench_classes,
+	"pipeline": bench_pipeline,
+	"product": bench_product,
+	"reduce": bench_reduce,
+	"to_fsm": bench_to_fsm,
+	"workers": bench_workers,
+}
+
+if __name__ == "__main__":
+	if len(sys.argv) < 3 or sys.argv[1] not in benchmarks:
+		print("Usage: python benchmark.py (" + "|".join(sorted(benchmarks)) + ") regexfile...")
+		sys.exit(1)
+	benchmarks[sys.argv[1]](sys.argv[2:])
@@ -4,6 +4,24 @@
 	Finite state machine library.
 '''
 
+import pickle
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from itertools import count
+from threading import Lock
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
 class anything_else_cls:
 	'''
 		This is a surrogate symbol which you can use in your finite state machines
@@ -16,11 +34,17 @@ class anything_else_cls:
 		return "anything_else"
 	def __repr__(self):
 		return "anything_else"
+	def __reduce__(self):
+		'''Unpickle as the one and only `anything_else`, not a copy.'''
+		return "anything_else"
 
 # We use a class instance because that gives us control over how the special
 # value gets serialised. Otherwise this would just be `object()`.
 anything_else = anything_else_cls()
 
+# The largest code point of a Unicode character. See `sfa`.
+maxunicode = sys.maxunicode
+
 def key(symbol):
 	'''Ensure `fsm.anything_else` always sorts last'''
 	return (symbol is anything_else, symbol)
@@ -34,6 +58,572 @@ class OblivionError(Exception):
 	'''
 	pass
 
+class BudgetError(Exception):
+	'''
+		This exception is thrown if an FSM under construction would have more
+		than `max_states` states, the budget set by `budget()` or by a
+		`max_states` argument. `states` is how many states had been found by
+		then, which is more than `max_states`, and `expanded` is how many of
+		those had had their transitions mapped.
+	'''
+	def __init__(self, max_states, states, expanded):
+		super().__init__(
+			"Exceeded the budget of " + repr(max_states) + " states, having found " +
+			repr(states) + " states and expanded " + repr(expanded)
+		)
+		self.max_states = max_states
+		self.states = states
+		self.expanded = expanded
+
+class CancelledError(Exception):
+	'''
+		This exception is thrown from inside a long operation, such as a
+		`crawl()`, running under `monitor()` with a `cancellation` which has
+		been cancelled or whose deadline has passed.
+	'''
+	pass
+
+class cancellation:
+	'''
+		A token for cancelling long operations cooperatively: run them under
+		`monitor(cancellation1)`, then call `cancellation1.cancel()` (e.g. from
+		another thread), or let `timeout` seconds pass. The operations check the
+		token periodically and stop with a `CancelledError`.
+	'''
+	def __init__(self, timeout=None):
+		self.deadline = None if timeout is None else time.monotonic() + timeout
+		self.cancelled = False
+
+	def __repr__(self):
+		return "cancellation(deadline = " + repr(self.deadline) + ", cancelled = " + repr(self.cancelled) + ")"
+
+	def cancel(self):
+		self.cancelled = True
+
+	def expired(self):
+		'''Whether the token has been cancelled, or its deadline has passed'''
+		return self.cancelled or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+class opcache:
+	'''
+		A bounded cache of the results of `fsm` operations, which you can turn on
+		with `use_cache()`. Results are keyed by the operation, its other
+		arguments and the `canonical()` forms of the FSMs involved, so a repeated
+		union, intersection, difference, concatenation or multiplication of FSMs
+		which are the same up to minimisation is only computed once. When the
+		cache holds `maxsize` results, the least recently used is discarded.
+		`hits` and `misses` count lookups. One cache may be used by several
+		threads at once.
+	'''
+	def __init__(self, maxsize=1024):
+		self.maxsize = maxsize
+		self.results = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = Lock()
+
+	def __len__(self):
+		return len(self.results)
+
+	def __repr__(self):
+		return "opcache(maxsize = " + repr(self.maxsize) + ", size = " + repr(len(self)) + \
+			", hits = " + repr(self.hits) + ", misses = " + repr(self.misses) + ")"
+
+	def get(self, key):
+		'''Return the result stored under `key`, or None'''
+		with self.lock:
+			if key in self.results:
+				self.hits += 1
+				self.results.move_to_end(key)
+				return self.results[key]
+			self.misses += 1
+			return None
+
+	def put(self, key, result):
+		with self.lock:
+			self.results[key] = result
+			self.results.move_to_end(key)
+			while len(self.results) > self.maxsize:
+				self.results.popitem(last=False)
+
+	def clear(self):
+		with self.lock:
+			self.results.clear()
+			self.hits = 0
+			self.misses = 0
+
+# The `opcache` in use in the current thread or context, if any. See
+# `use_cache()`.
+_opcache = ContextVar("opcache", default=None)
+
+def use_cache(cache):
+	'''
+		Cache the results of FSM operations in `cache`, an `opcache`, from now
+		on. Pass None to stop caching. Return the cache which was in use before.
+		Like `budget()`, this is local to the current thread (or `contextvars`
+		context).
+	'''
+	previous = _opcache.get()
+	_opcache.set(cache)
+	return previous
+
+# How many processes `crawl()` uses, in the current thread or context. See
+# `use_workers()`.
+_workers = ContextVar("workers", default=1)
+
+# The process pools used by parallel `crawl()`s, by number of processes. Each
+# is started the first time it's needed and then reused, since starting the
+# processes takes longer than many crawls.
+_executors = {}
+_executors_lock = Lock()
+
+# `_dense_product()` only vectorises breadth-first levels of at least this
+# many states. Below that, NumPy's overhead per call outweighs its speed.
+_dense_level = 64
+
+# `crawl()` only hands out breadth-first levels of at least this many states
+# to its worker processes. Smaller levels aren't worth the overhead.
+_parallel_level = 256
+
+def use_workers(workers):
+	'''
+		From now on, have `crawl()` follow the states of each large breadth-first
+		level in `workers` processes at once. Pass 1 to stop. Return the number
+		of processes used before. Like `budget()`, this is local to the current
+		thread (or `contextvars` context).
+	'''
+	previous = _workers.get()
+	_workers.set(workers)
+	return previous
+
+# The most states any FSM may have while it's being constructed, in the
+# current thread or context. See `budget()`.
+_max_states = ContextVar("max_states", default=None)
+
+@contextmanager
+def budget(max_states):
+	'''
+		Within this context, any FSM construction which would produce more than
+		`max_states` states (e.g. a `crawl()`, or a `repeat()` by chaining)
+		stops as soon as it finds out, with a `BudgetError`. The budget applies to
+		each FSM separately, not to their total. A budget inside another can
+		only be tighter. `budget(None)` changes nothing. Budgets are local to
+		the current thread (or `contextvars` context), so concurrent workers
+		can each have their own.
+	'''
+	current = _max_states.get()
+	if max_states is not None and (current is None or max_states < current):
+		current = max_states
+	token = _max_states.set(current)
+	try:
+		yield
+	finally:
+		_max_states.reset(token)
+
+# A tuple of the `(cancel, progress)` pairs of the `monitor()`s in force in the
+# current thread or context
+_monitors = ContextVar("monitors", default=())
+
+# How many states `crawl()` and the like map between calls to `_check()`
+_check_interval = 1000
+
+@contextmanager
+def monitor(cancel=None, progress=None):
+	'''
+		Within this context, long operations periodically check the
+		`cancellation` `cancel`, if any, and stop with a `CancelledError` if it
+		has expired. They also call `progress(operation, **counts)`, if supplied,
+		to say how far they have got:
+		* `progress("crawl", states=..., frontier=...)` every 1000 states mapped
+		by `crawl()` and the operations which use it, with the number of states
+		found and the number of those yet to be mapped
+		* `progress("reduce", blocks=..., waiting=...)` as `reduce()` refines
+		its partition, with the number of blocks and of splitters yet to try
+		* `progress("from_fsm", step=..., steps=...)` every 1000 states
+		eliminated by `lego.from_fsm()`
+		Long operations elsewhere can take part by calling `check_progress()`.
+		Monitors can be nested, and all of them are checked. They're local to
+		the current thread (or `contextvars` context), so operations in other
+		threads are unaffected.
+	'''
+	token = _monitors.set(_monitors.get() + ((cancel, progress),))
+	try:
+		yield
+	finally:
+		_monitors.reset(token)
+
+def check_progress(operation, done, **counts):
+	'''
+		For long operations outside this module: `done` counts the steps taken
+		so far, starting from 0. Every 1000 steps, report progress to every
+		`monitor()` in force, as `progress(operation, **counts)`, and stop with
+		a `CancelledError` if any of their cancellations has expired.
+	'''
+	if _monitors.get() and done % _check_interval == 0:
+		_check(operation, **counts)
+
+def _check(operation, **counts):
+	'''
+		Called periodically by long operations: report progress to every
+		`monitor()` in force and stop if any of their cancellations has expired.
+	'''
+	for (cancel, progress) in _monitors.get():
+		if progress is not None:
+			progress(operation, **counts)
+		if cancel is not None and cancel.expired():
+			raise CancelledError(operation + " was cancelled")
+
+def _cached(method):
+	'''
+		Look the result of this method call up in the `opcache` in use, if any,
+		before computing it. Calls with `reduce=False` aren't cached, since
+		computing the canonical forms of their operands would reduce them.
+	'''
+	@wraps(method)
+	def new_method(*args, **kwargs):
+		cache = _opcache.get()
+		if cache is None or not kwargs.get("reduce", True):
+			return method(*args, **kwargs)
+		key = (method.__name__,) + tuple(
+			arg.canonical() if isinstance(arg, fsm) else arg
+			for arg in args
+		) + tuple(sorted(kwargs.items()))
+		result = cache.get(key)
+		if result is None:
+			result = method(*args, **kwargs)
+			cache.put(key, result)
+		return result
+	return new_method
+
+class crawlstore:
+	'''
+		An on-disk store for a single `crawl()`, in an SQLite database at `path`,
+		for FSMs whose metastates or transitions don't fit in memory. The
+		metastates found so far, indexed by a canonical serialisation, and the
+		transitions of each state expanded so far, as a row of state numbers,
+		are kept in the database rather than in Python objects. Progress is
+		committed every `checkpoint` states, so if the crawl is interrupted then
+		crawling the same FSM with the same store resumes from the last
+		checkpoint instead of starting over. Once the crawl is complete, crawling
+		it again just loads the result. The result itself is an FSM in memory,
+		and operations which take a `store` still `reduce()` it in memory unless
+		they're passed `reduce=False`.
+	'''
+	def __init__(self, path, checkpoint=10000):
+		# Not every Python is built with SQLite, and only stores need it
+		import sqlite3
+		self.path = path
+		self.checkpoint = checkpoint
+		self.connection = sqlite3.connect(path)
+		self.connection.executescript('''
+			PRAGMA journal_mode = WAL;
+			PRAGMA synchronous = NORMAL;
+			CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB);
+			CREATE TABLE IF NOT EXISTS states (number INTEGER PRIMARY KEY, key BLOB UNIQUE, metastate BLOB);
+			CREATE TABLE IF NOT EXISTS rows (number INTEGER PRIMARY KEY, final INTEGER, targets BLOB);
+		''')
+
+	def __repr__(self):
+		return "crawlstore(" + repr(self.path) + ", checkpoint = " + repr(self.checkpoint) + ")"
+
+	def close(self):
+		'''Close the database, discarding any progress since the last checkpoint.'''
+		self.connection.close()
+
+class _translation(dict):
+	'''
+		A dict mapping any symbol to the symbol to look up in an FSM's map
+		instead. That's the symbol itself if it's in the FSM's alphabet, or if
+		`fsm.anything_else` isn't, otherwise it's `fsm.anything_else`. Entries for
+		symbols outside the alphabet are worked out the first time they're used.
+	'''
+	def __init__(self, alphabet):
+		super().__init__((symbol, symbol) for symbol in alphabet)
+		self.other = anything_else in alphabet
+
+	def __missing__(self, symbol):
+		actual = anything_else if self.other else symbol
+		self[symbol] = actual
+		return actual
+
+class table:
+	'''
+		A compact transition table for an FSM, as returned by `fsm.to_dense()`.
+		States are numbered 0 to `size - 1` and symbols are numbered by their
+		position in `symbols`, which is sorted with `fsm.anything_else` last.
+		`rows` is an `array("i")` holding `size` rows of `len(symbols)` entries
+		each: the transition from state i on the symbol numbered j is
+		`rows[i * len(symbols) + j]`, or -1 if it leads to the oblivion state.
+	'''
+	def __setattr__(self, name, value):
+		'''Immutability prevents some potential problems.'''
+		raise Exception("This object is immutable.")
+
+	def __init__(self, symbols, size, initial, finals, rows):
+		rows = array("i", rows)
+		self._init(symbols, size, initial, finals)
+		if len(rows) != size * len(self.symbols):
+			raise Exception("Expected " + repr(size * len(self.symbols)) + " transitions, not " + repr(len(rows)))
+		if len(rows) > 0 and not (-1 <= min(rows) and max(rows) < size):
+			raise Exception("Transitions must lead to one of range(" + repr(size) + ") or to -1")
+		self.__dict__["rows"] = rows
+
+	def _init(self, symbols, size, initial, finals):
+		'''Validate and store everything except the transitions themselves'''
+		symbols = tuple(sorted(symbols, key=key))
+		finals = frozenset(finals)
+		if not 0 <= initial < size:
+			raise Exception("Initial state " + repr(initial) + " must be one of range(" + repr(size) + ")")
+		for state in finals:
+			if not 0 <= state < size:
+				raise Exception("Final state " + repr(state) + " must be one of range(" + repr(size) + ")")
+
+		self.__dict__["symbols"] = symbols
+		self.__dict__["size"   ] = size
+		self.__dict__["initial"] = initial
+		self.__dict__["finals" ] = finals
+
+		# Symbol numbers. Unknown symbols are numbered as `anything_else` if
+		# possible, or None if not.
+		self.__dict__["index"  ] = dict((symbol, j) for (j, symbol) in enumerate(symbols))
+		self.__dict__["other"  ] = self.index.get(anything_else)
+
+	def __repr__(self):
+		string = "table("
+		string += "symbols = " + repr(self.symbols)
+		string += ", size = " + repr(self.size)
+		string += ", initial = " + repr(self.initial)
+		string += ", finals = " + repr(set(self.finals))
+		string += ", rows = " + repr(self.rows)
+		string += ")"
+		return string
+
+	def target(self, state, j):
+		'''The transition from `state` on the symbol numbered `j`, or -1'''
+		return self.rows[state * len(self.symbols) + j]
+
+	def follow(self, state, symbol):
+		'''
+			Return the state reached from `state` on `symbol`, or -1 for the
+			oblivion state. Symbols not in the alphabet are treated as
+			`fsm.anything_else`, if that is available.
+		'''
+		j = self.index.get(symbol, self.other)
+		if j is None or state == -1:
+			return -1
+		return self.target(state, j)
+
+	def accepts(self, input):
+		'''Run the table on the supplied string of symbols.'''
+		rows = self.rows
+		width = len(self.symbols)
+		index = self.index
+		other = self.other
+		state = self.initial
+		for symbol in input:
+			j = index.get(symbol, other)
+			if j is None:
+				return False
+			state = rows[state * width + j]
+			if state == -1:
+				return False
+		return state in self.finals
+
+	def compress(self):
+		'''
+			Return an equivalent `combtable`. Each state gets its most common
+			transition as a default, and only the exceptions to that default are
+			stored, packed into a single comb vector.
+		'''
+		width = len(self.symbols)
+		default = array("i", [-1]) * self.size
+		exceptions = []
+		for state in range(self.size):
+			row = self.rows[state * width:(state + 1) * width]
+			counts = {}
+			for t in row:
+				counts[t] = counts.get(t, 0) + 1
+			if len(counts) > 0:
+				# Ties go to -1, which is the cheapest default to explain
+				default[state] = max(counts, key=lambda t: (counts[t], t == -1))
+			exceptions.append([(j, t) for (j, t) in enumerate(row) if t != default[state]])
+
+		# Fit the rows with the most exceptions first, then the rest into the gaps.
+		base = array("i", [0]) * self.size
+		next = array("i")
+		check = array("i")
+		free = 0
+		for state in sorted(range(self.size), key=lambda state: -len(exceptions[state])):
+			if len(exceptions[state]) == 0:
+				continue
+			first = exceptions[state][0][0]
+			b = free - first
+			while any(
+				b + j < len(check) and check[b + j] != -1
+				for (j, t) in exceptions[state]
+			):
+				b += 1
+			end = b + exceptions[state][-1][0] + 1
+			if end > len(check):
+				next.extend([-1] * (end - len(check)))
+				check.extend([-1] * (end - len(check)))
+			for (j, t) in exceptions[state]:
+				next[b + j] = t
+				check[b + j] = state
+			base[state] = b
+			while free < len(check) and check[free] != -1:
+				free += 1
+
+		return combtable(
+			symbols = self.symbols,
+			size    = self.size,
+			initial = self.initial,
+			finals  = self.finals,
+			default = default,
+			base    = base,
+			next    = next,
+			check   = check,
+		)
+
+class combtable(table):
+	'''
+		A `table` compressed using row displacement, as in lex: most states send
+		most symbols to the same place, so each state has a `default` target and
+		only the exceptions are stored. Exceptions for all states are packed
+		into the shared `next` and `check` arrays, offset by each state's entry in
+		`base`. The transition from state i on the symbol numbered j is
+		`next[base[i] + j]` if `check[base[i] + j] == i`, else `default[i]`.
+	'''
+	def __init__(self, symbols, size, initial, finals, default, base, next, check):
+		default = array("i", default)
+		base = array("i", base)
+		next = array("i", next)
+		check = array("i", check)
+		self._init(symbols, size, initial, finals)
+		if len(default) != size or len(base) != size:
+			raise Exception("Expected a default and a base for each of " + repr(size) + " states")
+		if len(next) != len(check):
+			raise Exception("`next` and `check` must have the same length")
+		for targets in [default, next]:
+			if len(targets) > 0 and not (-1 <= min(targets) and max(targets) < size):
+				raise Exception("Transitions must lead to one of range(" + repr(size) + ") or to -1")
+		self.__dict__["default"] = default
+		self.__dict__["base"   ] = base
+		self.__dict__["next"   ] = next
+		self.__dict__["check"  ] = check
+
+	def __repr__(self):
+		string = "combtable("
+		string += "symbols = " + repr(self.symbols)
+		string += ", size = " + repr(self.size)
+		string += ", initial = " + repr(self.initial)
+		string += ", finals = " + repr(set(self.finals))
+		string += ", default = " + repr(self.default)
+		string += ", base = " + repr(self.base)
+		string += ", next = " + repr(self.next)
+		string += ", check = " + repr(self.check)
+		string += ")"
+		return string
+
+	def target(self, state, j):
+		k = self.base[state] + j
+		if 0 <= k < len(self.check) and self.check[k] == state:
+			return self.next[k]
+		return self.default[state]
+
+	def accepts(self, input):
+		'''Run the compressed table on the supplied string of symbols.'''
+		default = self.default
+		base = self.base
+		next = self.next
+		check = self.check
+		index = self.index
+		other = self.other
+		state = self.initial
+		for symbol in input:
+			j = index.get(symbol, other)
+			if j is None:
+				return False
+			k = base[state] + j
+			if 0 <= k < len(check) and check[k] == state:
+				state = next[k]
+			else:
+				state = default[state]
+			if state == -1:
+				return False
+		return state in self.finals
+
+	def compress(self):
+		return self
+
+	def expand(self):
+		'''Return the equivalent uncompressed `table`'''
+		return table(
+			symbols = self.symbols,
+			size    = self.size,
+			initial = self.initial,
+			finals  = self.finals,
+			rows    = [
+				self.target(state, j)
+				for state in range(self.size)
+				for j in range(len(self.symbols))
+			],
+		)
+
+class _rowview(Mapping):
+	'''A read-only view of one state's transitions in a `table`'''
+	def __init__(self, table, state):
+		self.table = table
+		self.state = state
+
+	def __getitem__(self, symbol):
+		j = self.table.index.get(symbol)
+		if j is not None:
+			t = self.table.target(self.state, j)
+			if t != -1:
+				return t
+		raise KeyError(symbol)
+
+	def __contains__(self, symbol):
+		j = self.table.index.get(symbol)
+		return j is not None and self.table.target(self.state, j) != -1
+
+	def __iter__(self):
+		for (j, symbol) in enumerate(self.table.symbols):
+			if self.table.target(self.state, j) != -1:
+				yield symbol
+
+	def __len__(self):
+		return sum(1 for symbol in self)
+
+	def __repr__(self):
+		return repr(dict(self))
+
+class _mapview(Mapping):
+	'''
+		A read-only view of a `table` which looks like the dict of dicts used as
+		`fsm.map`. Nothing is expanded: rows are read from the table on demand.
+	'''
+	def __init__(self, table):
+		self.table = table
+
+	def __getitem__(self, state):
+		if state in self:
+			return _rowview(self.table, state)
+		raise KeyError(state)
+
+	def __contains__(self, state):
+		return isinstance(state, int) and 0 <= state < self.table.size
+
+	def __iter__(self):
+		return iter(range(self.table.size))
+
+	def __len__(self):
+		return self.table.size
+
+	def __repr__(self):
+		return repr(dict((state, dict(row)) for (state, row) in self.items()))
+
 class fsm:
 	'''
 		A Finite State Machine or FSM has an alphabet and a set of states. At any
@@ -47,6 +637,9 @@ class fsm:
 		be concatenated, alternated between, multiplied, looped (Kleene star
 		closure), intersected, and simplified.
 		The majority of these methods are available using operator overloads.
+		FSMs are immutable, so anything derived from one (its live states, its
+		canonical form and so on) is computed the first time it's needed and
+		then cached in the FSM. Don't modify what such methods return.
 	'''
 	def __setattr__(self, name, value):
 		'''Immutability prevents some potential problems.'''
@@ -79,6 +672,279 @@ class fsm:
 		self.__dict__["finals"  ] = set(finals)
 		self.__dict__["map"     ] = map
 
+	@classmethod
+	def _trusted(cls, alphabet, states, initial, finals, map, minimal=False):
+		'''
+			Construct an FSM from parts which are known to be valid, without
+			checking or copying them. This is for FSMs built by this module: the
+			caller must pass sets (or, for `states`, a `range`) which nobody will
+			modify afterwards, since they are shared with the new FSM. Pass
+			`minimal=True` only if the FSM is exactly what `reduce()` would return.
+		'''
+		self = cls.__new__(cls)
+		if minimal:
+			self.__dict__["_minimal"] = True
+		self.__dict__["alphabet"] = alphabet
+		if isinstance(states, range):
+			self.__dict__["_state_range"] = states
+		else:
+			self.__dict__["states"] = states
+		self.__dict__["initial" ] = initial
+		self.__dict__["finals"  ] = finals
+		self.__dict__["map"     ] = map
+		return self
+
+	def __getattr__(self, name):
+		'''
+			An FSM created by `fsm.from_dense()` keeps its transitions in a `table`.
+			Its `map` is a read-only view of that table and its `states` are only
+			materialised if somebody asks for them. The same goes for the `states`
+			of an FSM whose states were numbered by `crawl()`.
+		'''
+		if name == "states" and "_state_range" in self.__dict__:
+			self.__dict__["states"] = set(self.__dict__["_state_range"])
+			return self.__dict__["states"]
+		if "_table" in self.__dict__:
+			table = self.__dict__["_table"]
+			if name == "states":
+				self.__dict__["states"] = set(range(table.size))
+				return self.__dict__["states"]
+			if name == "map":
+				self.__dict__["map"] = _mapview(table)
+				return self.__dict__["map"]
+		raise AttributeError(name)
+
+	def __getstate__(self):
+		'''
+			When pickling, leave out anything which can be recomputed. In
+			particular, an FSM with a `table` is pickled as just that table.
+		'''
+		state = dict(
+			(name, value)
+			for (name, value) in self.__dict__.items()
+			if not name.startswith("_") or name in {"_table", "_state_range", "_minimal"}
+		)
+		if "_state_range" in state:
+			state.pop("states", None)
+		if "_table" in state:
+			state.pop("states", None)
+			state.pop("map", None)
+		return state
+
+	@classmethod
+	def from_dense(cls, table):
+		'''
+			Return an FSM whose transitions are stored in the supplied `table`
+			rather than in a dict of dicts. `map` and `states` become lazily
+			materialised views, and `accepts()` runs directly on the table.
+		'''
+		self = cls.__new__(cls)
+		self.__dict__["alphabet"] = set(table.symbols)
+		self.__dict__["initial" ] = table.initial
+		self.__dict__["finals"  ] = set(table.finals)
+		self.__dict__["_table"  ] = table
+		return self
+
+	def to_dense(self):
+		'''
+			Return the present FSM's transitions as a compact `table`. If the states
+			are already 0 to n - 1 then their numbers are kept. Otherwise they are
+			renumbered in the order a crawl from the initial state finds them, then
+			any unreachable states follow.
+		'''
+		if "_table" in self.__dict__:
+			return self.__dict__["_table"]
+
+		symbols = sorted(self.alphabet, key=key)
+		if self.states == set(range(len(self.states))):
+			order = list(range(len(self.states)))
+		else:
+			order = self._reachable(symbols)
+			seen = set(order)
+			order.extend(state for state in self.states if state not in seen)
+		number = dict((state, i) for (i, state) in enumerate(order))
+
+		rows = array("i", [-1]) * (len(order) * len(symbols))
+		for state in self.map:
+			if state not in number:
+				continue
+			for (j, symbol) in enumerate(symbols):
+				if symbol in self.map[state]:
+					rows[number[state] * len(symbols) + j] = number[self.map[state][symbol]]
+
+		return table(
+			symbols = symbols,
+			size    = len(order),
+			initial = number[self.initial],
+			finals  = [number[state] for state in self.finals],
+			rows    = rows,
+		)
+
+	@classmethod
+	def from_symbolic(cls, symbolic, alphabet=None):
+		'''
+			Return an FSM equivalent to the supplied `sfa`, whose alphabet consists
+			of single characters and `anything_else`. Every character outside
+			`alphabet` is treated as `anything_else`, so if that's in `alphabet`
+			they must all behave the same way. By default, `anything_else` stands
+			for whichever characters behave the same way as most of Unicode and
+			every other character is in the alphabet.
+		'''
+		refinement = symbolic._refinement()
+		classes = symbolic._classes(refinement)
+		states = list(symbolic.states)
+		columns = [
+			tuple(classes.map.get(state, {}).get(interval) for state in states)
+			for interval in refinement
+		]
+
+		if alphabet is None:
+			sizes = {}
+			for ((lo, hi), column) in zip(refinement, columns):
+				sizes[column] = sizes.get(column, 0) + hi + 1 - lo
+			other = max(sizes, key=sizes.get)
+			alphabet = {anything_else}
+			for ((lo, hi), column) in zip(refinement, columns):
+				if column != other:
+					alphabet.update(chr(i) for i in range(lo, hi + 1))
+		else:
+			alphabet = set(alphabet)
+			for symbol in alphabet:
+				if symbol is not anything_else and not (isinstance(symbol, str) and len(symbol) == 1):
+					raise Exception("Symbol " + repr(symbol) + " isn't a single character")
+			chars = sorted(ord(symbol) for symbol in alphabet if symbol is not anything_else)
+			outside = set(
+				column
+				for ((lo, hi), column) in zip(refinement, columns)
+				if bisect_right(chars, hi) - bisect_left(chars, lo) < hi + 1 - lo
+			)
+			if anything_else in alphabet and len(outside) > 1:
+				raise Exception("Characters outside " + repr(alphabet) + " don't all behave the same way")
+			other = outside.pop() if outside else None
+
+		starts = [lo for (lo, hi) in refinement]
+		map = dict((state, {}) for state in states)
+		for symbol in alphabet:
+			if symbol is anything_else:
+				column = other
+			else:
+				column = columns[bisect_right(starts, ord(symbol)) - 1]
+			if column is None:
+				continue
+			for (state, next) in zip(states, column):
+				if next is not None:
+					map[state][symbol] = next
+
+		return cls._trusted(
+			alphabet = alphabet,
+			states   = set(states),
+			initial  = symbolic.initial,
+			finals   = set(symbolic.finals),
+			map      = map,
+		)
+
+	def to_symbolic(self):
+		'''
+			Return an equivalent `sfa`. The alphabet must consist of single
+			characters and, optionally, `anything_else`, which stands for every
+			other Unicode character.
+		'''
+		for symbol in self.alphabet:
+			if symbol is not anything_else and not (isinstance(symbol, str) and len(symbol) == 1):
+				raise Exception("Symbol " + repr(symbol) + " isn't a single character")
+		chars = sorted(ord(symbol) for symbol in self.alphabet if symbol is not anything_else)
+
+		# The intervals of characters which are `anything_else`
+		gaps = []
+		for (lo, hi) in zip([-1] + chars, chars + [maxunicode + 1]):
+			if lo + 1 < hi:
+				gaps.append((lo + 1, hi - 1))
+
+		map = {}
+		for (state, transitions) in self.map.items():
+			intervals = [(i, i, transitions[chr(i)]) for i in chars if chr(i) in transitions]
+			if anything_else in transitions:
+				intervals.extend((lo, hi, transitions[anything_else]) for (lo, hi) in gaps)
+			map[state] = _merge(sorted(intervals, key=lambda transition: transition[0]))
+
+		return sfa._trusted(
+			states  = set(self.states),
+			initial = self.initial,
+			finals  = set(self.finals),
+			map     = map,
+		)
+
+	def compress_alphabet(self):
+		'''
+			Partition the alphabet into classes of symbols which have the same
+			transitions from every state, since an FSM can't tell them apart.
+			Return a tuple `(compressed, classes)`, where `classes` maps each symbol
+			to a representative of its class, the first in sorted order, and
+			`compressed` is an equivalent FSM whose alphabet consists only of the
+			representatives.
+			Every crawl and product over `compressed` costs less by the ratio of
+			the alphabet sizes. Input to `compressed` must be translated using
+			`classes` first. See `expand_alphabet()`.
+		'''
+		states = list(self.map)
+		groups = {}
+		for symbol in sorted(self.alphabet, key=key):
+			signature = tuple(self.map[state].get(symbol) for state in states)
+			groups.setdefault(signature, []).append(symbol)
+
+		classes = {}
+		for members in groups.values():
+			for symbol in members:
+				classes[symbol] = members[0]
+
+		representatives = set(classes.values())
+		map = dict(
+			(state, dict(
+				(symbol, next)
+				for (symbol, next) in self.map[state].items()
+				if symbol in representatives
+			))
+			for state in states
+		)
+		compressed = fsm._trusted(
+			alphabet = representatives,
+			states   = self.states,
+			initial  = self.initial,
+			finals   = self.finals,
+			map      = map,
+		)
+		return (compressed, classes)
+
+	def expand_alphabet(self, classes):
+		'''
+			The inverse of `compress_alphabet()`: given `classes` mapping symbols to
+			representatives in the present FSM's alphabet, return an equivalent FSM
+			over all of those symbols, in which each symbol behaves like its
+			representative. If the present FSM is minimal and each representative
+			is the first of its class in sorted order, then so is the result: its
+			states are even numbered the same way `reduce()` would number them.
+		'''
+		minimal = "_minimal" in self.__dict__ and all(
+			key(representative) <= key(symbol)
+			for (symbol, representative) in classes.items()
+		)
+		map = {}
+		for state in self.map:
+			row = self.map[state]
+			map[state] = dict(
+				(symbol, row[representative])
+				for (symbol, representative) in classes.items()
+				if representative in row
+			)
+		return fsm._trusted(
+			alphabet = set(classes),
+			states   = self.states,
+			initial  = self.initial,
+			finals   = self.finals,
+			map      = map,
+			minimal  = minimal,
+		)
+
 	def accepts(self, input):
 		'''
 			Test whether the present FSM accepts the supplied string (iterable of
@@ -88,18 +954,28 @@ class fsm:
 			If `fsm.anything_else` is in your alphabet, then any symbol not in your
 			alphabet will be converted to `fsm.anything_else`.
 		'''
+		if "_table" in self.__dict__:
+			return self.__dict__["_table"].accepts(input)
+
+		translator = self._translator()
+		map = self.map
 		state = self.initial
 		for symbol in input:
-			if anything_else in self.alphabet and not symbol in self.alphabet:
-				symbol = anything_else
+			symbol = translator[symbol]
 
 			# Missing transition = transition to dead state
-			if not (state in self.map and symbol in self.map[state]):
+			if not (state in map and symbol in map[state]):
 				return False
 
-			state = self.map[state][symbol]
+			state = map[state][symbol]
 		return state in self.finals
 
+	def _translator(self):
+		'''Return a `_translation` for the present FSM's alphabet'''
+		if "_translator_cache" not in self.__dict__:
+			self.__dict__["_translator_cache"] = _translation(self.alphabet)
+		return self.__dict__["_translator_cache"]
+
 	def __contains__(self, string):
 		'''
 			This lets you use the syntax `"a" in fsm1` to see whether the string "a"
@@ -107,15 +983,357 @@ class fsm:
 		'''
 		return self.accepts(string)
 
-	def reduce(self):
-		'''
-			A result by Brzozowski (1963) shows that a minimal finite state machine
-			equivalent to the original can be obtained by reversing the original
-			twice.
-		'''
-		return reversed(reversed(self))
+	def reduce(self, method="hopcroft"):
+		'''
+			Return a minimal finite state machine equivalent to the original.
+			Unreachable states and dead states are omitted, and states are numbered
+			in the order in which a breadth-first search from the initial state
+			(following symbols in sorted order) discovers them, so both methods
+			return identical results:
+			* "hopcroft" refines a partition of the existing states, see Hopcroft
+			(1971). This takes O(n k log n) time for n states and k symbols.
+			* "brzozowski" uses a result by Brzozowski (1963) which shows that a
+			minimal finite state machine equivalent to the original can be obtained
+			by reversing the original twice. Each reversal is a subset construction
+			which can blow up exponentially, even if the result is small.
+			* "numpy" refines a partition of the states of `to_dense()` in rounds,
+			as Moore (1956) does, using NumPy array operations. Each round takes
+			O(n k log n) time, but there can be as many rounds as the longest
+			shortest string distinguishing two states, so this suits large, shallow
+			FSMs. The result is dense. Without NumPy, this falls back to "hopcroft".
+			The result is flagged as minimal, and so are the results of operations
+			which reduce before returning, so reducing them again is free.
+		'''
+		if method not in {"hopcroft", "brzozowski", "numpy"}:
+			raise Exception("Unknown reduce() method " + repr(method))
+		if "_minimal" in self.__dict__:
+			return self
+		if method == "numpy" and np is not None:
+			return self._moore()
+		if method != "brzozowski":
+			return self._hopcroft()
+		result = reversed(reversed(self))
+		result.__dict__["_minimal"] = True
+		return result
+
+	def canonical(self):
+		'''
+			Return a hashable canonical form of the present FSM: its alphabet, and
+			the final states and transitions of `reduce()`, whose states are
+			numbered in a fixed order. Two FSMs with the same alphabet have the same
+			canonical form exactly when they recognise the same strings.
+		'''
+		if "_canonical_form" not in self.__dict__:
+			reduced = self.reduce()
+			symbols = sorted(reduced.alphabet, key=key)
+			self.__dict__["_canonical_form"] = (
+				frozenset(reduced.alphabet),
+				frozenset(reduced.finals),
+				tuple(
+					tuple(
+						(symbol, reduced.map[state][symbol])
+						for symbol in symbols
+						if symbol in reduced.map[state]
+					)
+					for state in range(len(reduced.states))
+				),
+			)
+		return self.__dict__["_canonical_form"]
+
+	def __hash__(self):
+		'''
+			FSMs which recognise the same strings must hash the same, even if their
+			alphabets differ (see `__eq__()`). So rather than hashing the canonical
+			form, we hash what doesn't depend on the alphabet: for each state of the
+			minimal FSM, the length of the shortest string leading to it and whether
+			it's final.
+		'''
+		if "_hash" not in self.__dict__:
+			reduced = self.reduce()
+			depth = {reduced.initial: 0}
+			order = [reduced.initial]
+			i = 0
+			while i < len(order):
+				current = order[i]
+				for next in reduced.map[current].values():
+					if next not in depth:
+						depth[next] = depth[current] + 1
+						order.append(next)
+				i += 1
+			self.__dict__["_hash"] = hash(tuple(sorted(
+				(depth[state], state in reduced.finals) for state in order
+			)))
+		return self.__dict__["_hash"]
+
+	def _hopcroft(self):
+		'''
+			Minimise using Hopcroft's partition refinement algorithm. The states are
+			first trimmed down to those which are reachable and live. Missing
+			transitions go to a single explicit dead state, which keeps the machine
+			complete while the partition is refined.
+		'''
+		symbols = sorted(self.alphabet, key=key)
+
+		# Reachable states, numbered in breadth-first order
+		reachable = self._reachable(symbols)
+		number = dict((state, s) for (s, state) in enumerate(reachable))
+
+		# Transitions by number
+		n = len(reachable)
+		row = self._rows(symbols)
+		delta = [None] * n
+		back = [[] for s in range(n)]
+		for s in range(n):
+			delta[s] = [None if next is None else number[next] for next in row(reachable[s])]
+			for t in delta[s]:
+				if t is not None:
+					back[t].append(s)
+
+		# Live states: those from which a final state can be reached
+		live = [reachable[s] in self.finals for s in range(n)]
+		stack = [s for s in range(n) if live[s]]
+		while len(stack) > 0:
+			t = stack.pop()
+			for s in back[t]:
+				if not live[s]:
+					live[s] = True
+					stack.append(s)
+
+		if not live[0]:
+			return fsm._trusted(
+				alphabet = self.alphabet,
+				states   = {0},
+				initial  = 0,
+				finals   = set(),
+				map      = {0: {}},
+				minimal  = True,
+			)
+
+		# Complete the machine with an explicit dead state, which absorbs every
+		# missing transition and every transition into a state that isn't live.
+		# Then compute the inverse of the transition function.
+		dead = n
+		states = [s for s in range(n) if live[s]]
+		inverse = [dict((t, []) for t in states + [dead]) for symbol in symbols]
+		for a in range(len(symbols)):
+			inverse[a][dead].append(dead)
+			for s in states:
+				t = delta[s][a]
+				if t is None or not live[t]:
+					t = dead
+				inverse[a][t].append(s)
+
+		# Initial partition: final, live non-final and dead. Then repeatedly split
+		# blocks by the preimage of a block under a symbol.
+		blocks = [
+			set(s for s in states if reachable[s] in self.finals),
+			set(s for s in states if reachable[s] not in self.finals),
+			{dead},
+		]
+		blocks = [block for block in blocks if len(block) > 0]
+		blockof = {}
+		for (b, block) in enumerate(blocks):
+			for s in block:
+				blockof[s] = b
+
+		# It suffices to split by all but one of the initial blocks
+		largest = max(range(len(blocks)), key=lambda b: len(blocks[b]))
+		waiting = [
+			(b, a)
+			for b in range(len(blocks)) if b != largest
+			for a in range(len(symbols))
+		]
+		splits = 0
+		while len(waiting) > 0:
+			splits += 1
+			if _monitors.get() and splits % _check_interval == 0:
+				_check("reduce", blocks=len(blocks), waiting=len(waiting))
+			(b, a) = waiting.pop()
+			preimage = {}
+			for t in blocks[b]:
+				for s in inverse[a][t]:
+					preimage.setdefault(blockof[s], set()).add(s)
+			for (y, split) in preimage.items():
+				if len(split) == len(blocks[y]):
+					continue
+				# Split in place, so that the work done is bounded by the size of the
+				# preimage rather than the size of the block. The smaller half gets
+				# the new block number.
+				blocks[y].difference_update(split)
+				if len(split) > len(blocks[y]):
+					(blocks[y], split) = (split, blocks[y])
+				z = len(blocks)
+				blocks.append(split)
+				for s in split:
+					blockof[s] = z
+				# Whether or not (y, c) is still waiting, it's enough to add the
+				# smaller half of the split.
+				waiting.extend((z, c) for c in range(len(symbols)))
+
+		# Number the blocks the same way `crawl()` would. Every state in a block has
+		# the same transitions (up to blocks) so any one will do.
+		order = [blockof[0]]
+		renumber = {blockof[0]: 0}
+		map = {}
+		i = 0
+		while i < len(order):
+			s = min(blocks[order[i]])
+			map[i] = {}
+			for (a, symbol) in enumerate(symbols):
+				t = delta[s][a]
+				if t is None or not live[t]:
+					continue
+				if blockof[t] not in renumber:
+					renumber[blockof[t]] = len(order)
+					order.append(blockof[t])
+				map[i][symbol] = renumber[blockof[t]]
+			i += 1
+
+		return fsm._trusted(
+			alphabet = self.alphabet,
+			states   = range(len(order)),
+			initial  = 0,
+			finals   = set(
+				i for i in range(len(order))
+				if reachable[min(blocks[order[i]])] in self.finals
+			),
+			map      = map,
+			minimal  = True,
+		)
+
+	def _moore(self):
+		'''
+			Minimise using Moore's partition refinement algorithm, vectorised with
+			NumPy. The table is completed with a dead state, so every state which
+			isn't live ends up in the dead state's block. In each round, each
+			state's block and its successors' blocks make a row, and states with
+			identical rows form the blocks of the next round. The refinement is
+			finished when a round doesn't increase the number of blocks.
+		'''
+		t = self.to_dense()
+		if isinstance(t, combtable):
+			t = t.expand()
+		width = len(t.symbols)
+
+		# Transitions, with the dead state numbered `t.size`
+		dead = t.size
+		delta = np.full((t.size + 1, width), dead, dtype=np.int64)
+		delta[:t.size] = np.frombuffer(t.rows, dtype=np.intc).reshape(t.size, width)
+		delta[delta == -1] = dead
+
+		finals = np.zeros(t.size + 1, dtype=np.int64)
+		finals[list(t.finals)] = 1
+		(_, block) = np.unique(finals, return_inverse=True)
+		count = block.max() + 1
+		while True:
+			if _monitors.get():
+				_check("reduce", blocks=int(count), waiting=None)
+			signature = np.column_stack([block, block[delta]])
+			(_, block) = np.unique(signature, axis=0, return_inverse=True)
+			block = block.reshape(-1)
+			if block.max() + 1 == count:
+				break
+			count = block.max() + 1
+
+		if block[t.initial] == block[dead]:
+			return fsm._trusted(
+				alphabet = self.alphabet,
+				states   = {0},
+				initial  = 0,
+				finals   = set(),
+				map      = {0: {}},
+				minimal  = True,
+			)
+
+		# Transitions between blocks, taken from any one state of each. Those
+		# into the dead state's block are omitted.
+		(_, representative) = np.unique(block, return_index=True)
+		step = block[delta[representative]]
+		step[step == block[dead]] = -1
+
+		# Number the blocks the same way `crawl()` would, a breadth-first level at
+		# a time, in order of first appearance
+		number = np.full(count, -1, dtype=np.int64)
+		number[block[t.initial]] = 0
+		order = [np.array([block[t.initial]])]
+		size = 1
+		frontier = order[0]
+		while len(frontier) > 0:
+			next = step[frontier].ravel()
+			next = next[next != -1]
+			(unique, first) = np.unique(next, return_index=True)
+			new = unique[number[unique] == -1]
+			new = new[np.argsort(first[number[unique] == -1], kind="stable")]
+			number[new] = np.arange(size, size + len(new))
+			size += len(new)
+			order.append(new)
+			frontier = new
+		order = np.concatenate(order)
+
+		rows = step[order]
+		rows[rows != -1] = number[rows[rows != -1]]
+		array_rows = array("i")
+		array_rows.frombytes(rows.astype(np.intc).tobytes())
+		result = fsm.from_dense(table(
+			symbols = t.symbols,
+			size    = size,
+			initial = 0,
+			finals  = np.flatnonzero(finals[representative[order]]).tolist(),
+			rows    = array_rows,
+		))
+		result.__dict__["alphabet"] = self.alphabet
+		result.__dict__["_minimal"] = True
+		return result
+
+	def _reachable(self, symbols):
+		'''
+			Return a list of the states reachable from the initial state, in the
+			order in which a breadth-first search following `symbols` in order finds
+			them. This is the order in which `crawl()` numbers states.
+		'''
+		row = self._rows(symbols)
+		order = [self.initial]
+		seen = {self.initial}
+		i = 0
+		while i < len(order):
+			for next in row(order[i]):
+				if next is not None and next not in seen:
+					seen.add(next)
+					order.append(next)
+			i += 1
+		return order
+
+	def _rows(self, symbols):
+		'''
+			Return a function which takes a state and returns a list of its
+			transitions on each of `symbols` in turn, with None for each missing
+			transition. An FSM with a `table` reads it directly, rather than
+			through the views which make up its `map`.
+		'''
+		t = self.__dict__.get("_table")
+		if t is not None and tuple(symbols) == t.symbols:
+			width = len(symbols)
+			if isinstance(t, combtable):
+				target = t.target
+				def row(state):
+					return [None if next == -1 else next for next in map(target, [state] * width, range(width))]
+			else:
+				rows = t.rows
+				def row(state):
+					return [None if next == -1 else next for next in rows[state * width:(state + 1) * width]]
+			return row
+
+		transitions = self.map
+		def row(state):
+			if state not in transitions:
+				return [None] * len(symbols)
+			current = transitions[state]
+			return [current[symbol] if symbol in current else None for symbol in symbols]
+		return row
 
 	def __repr__(self):
+		if "_table" in self.__dict__:
+			return "fsm.from_dense(" + repr(self.__dict__["_table"]) + ")"
 		string = "fsm("
 		string += "alphabet = " + repr(self.alphabet)
 		string += ", states = " + repr(self.states)
@@ -167,56 +1385,70 @@ class fsm:
 
 		return "".join("".join(row) + "\n" for row in rows)
 
-	def concatenate(*fsms):
+	@_cached
+	def concatenate(*fsms, reduce=True):
 		'''
-			Concatenate arbitrarily many finite state machines together.
+			Concatenate arbitrarily many finite state machines together. Like every
+			operation which returns a new FSM, the result is `reduce()`d unless you
+			pass `reduce=False`. That's useful when the result is only going to be
+			fed into more operations: you can reduce once, at the end.
 		'''
 		alphabet = set().union(*[fsm.alphabet for fsm in fsms])
 
+		# Number the states of all FSMs at once, so that a metastate can be a
+		# bitset over pairs (i, substate).
+		number = {}
+		for (i, fsm) in enumerate(fsms):
+			for substate in fsm.states:
+				number[(i, substate)] = len(number)
+
 		def connect_all(i, substate):
 			'''
-				Take a state in the numbered FSM and return a set containing it, plus
+				Take a state in the numbered FSM and return a bitset containing it, plus
 				(if it's final) the first state from the next FSM, plus (if that's
 				final) the first state from the next but one FSM, plus...
 			'''
-			result = {(i, substate)}
+			result = 1 << number[(i, substate)]
 			while i < len(fsms) - 1 and substate in fsms[i].finals:
 				i += 1
 				substate = fsms[i].initial
-				result.add((i, substate))
+				result |= 1 << number[(i, substate)]
 			return result
 
+		closures = dict((pair, connect_all(*pair)) for pair in number)
+
+		# Precompute where each substate goes on each symbol
+		step = [None] * len(number)
+		for ((i, substate), n) in number.items():
+			step[n] = {}
+			if substate in fsms[i].map:
+				for (symbol, next) in fsms[i].map[substate].items():
+					step[n][symbol] = closures[(i, next)]
+
 		# Use a superset containing states from all FSMs at once.
 		# We start at the start of the first FSM. If this state is final in the
 		# first FSM, then we are also at the start of the second FSM. And so on.
-		initial = set()
+		initial = 0
 		if len(fsms) > 0:
-			initial.update(connect_all(0, fsms[0].initial))
-		initial = frozenset(initial)
+			initial = closures[(0, fsms[0].initial)]
+
+		# If you're in a final state of the final FSM, it's final
+		finals = 0
+		if len(fsms) > 0:
+			for substate in fsms[-1].finals:
+				finals |= 1 << number[(len(fsms) - 1, substate)]
 
 		def final(state):
-			'''If you're in a final state of the final FSM, it's final'''
-			for (i, substate) in state:
-				if i == len(fsms) - 1 and substate in fsms[i].finals:
-					return True
-			return False
+			return state & finals != 0
 
-		def follow(current, symbol):
-			'''
-				Follow the collection of states through all FSMs at once, jumping to the
-				next FSM if we reach the end of the current one
-				TODO: improve all follow() implementations to allow for dead metastates?
-			'''
-			next = set()
-			for (i, substate) in current:
-				fsm = fsms[i]
-				if substate in fsm.map and symbol in fsm.map[substate]:
-					next.update(connect_all(i, fsm.map[substate][symbol]))
-			if len(next) == 0:
-				raise OblivionError
-			return frozenset(next)
+		# Follow the collection of states through all FSMs at once, jumping to
+		# the next FSM if we reach the end of the current one
+		follow = _subset_follow(step)
 
-		return crawl(alphabet, initial, final, follow).reduce()
+		result = _crawl(alphabet, initial, final, follow)
+		if reduce:
+			result = result.reduce()
+		return result
 
 	def __add__(self, other):
 		'''
@@ -228,7 +1460,7 @@ class fsm:
 		'''
 		return self.concatenate(other)
 
-	def star(self):
+	def star(self, reduce=True):
 		'''
 			If the present FSM accepts X, returns an FSM accepting X* (i.e. 0 or
 			more Xes). This is NOT as simple as naively connecting the final states
@@ -236,66 +1468,186 @@ class fsm:
 		'''
 		alphabet = self.alphabet
 
-		initial = {self.initial}
+		number = dict((substate, n) for (n, substate) in enumerate(self.states))
+
+		initial = 1 << number[self.initial]
+
+		# If one of our substates is final, then we can also consider
+		# transitions from the initial state of the original FSM.
+		step = [None] * len(number)
+		for (substate, n) in number.items():
+			step[n] = {}
+			if substate in self.map:
+				for (symbol, next) in self.map[substate].items():
+					step[n][symbol] = 1 << number[next]
+			if substate in self.finals and self.initial in self.map:
+				for (symbol, next) in self.map[self.initial].items():
+					step[n][symbol] = step[n].get(symbol, 0) | 1 << number[next]
+
+		finals = 0
+		for substate in self.finals:
+			finals |= 1 << number[substate]
+
+		# X* must accept the empty string. If the initial state isn't final, start
+		# instead from a new final substate with the same transitions out. This
+		# saves taking the union with `epsilon()` afterwards.
+		if self.initial not in self.finals:
+			fresh = len(number)
+			step.append(step[number[self.initial]])
+			initial = 1 << fresh
+			finals |= initial
+
+		follow = _subset_follow(step)
 
-		def follow(state, symbol):
-			next = set()
-			for substate in state:
-				if substate in self.map and symbol in self.map[substate]:
-					next.add(self.map[substate][symbol])
+		def final(state):
+			return state & finals != 0
 
-				# If one of our substates is final, then we can also consider
-				# transitions from the initial state of the original FSM.
-				if substate in self.finals \
-				and self.initial in self.map \
-				and symbol in self.map[self.initial]:
-					next.add(self.map[self.initial][symbol])
+		result = _crawl(alphabet, initial, final, follow)
+		if reduce:
+			result = result.reduce()
+		return result
 
-			if len(next) == 0:
-				raise OblivionError
+	def optional(self):
+		'''
+			If the present FSM accepts X, returns an FSM accepting X? (i.e. 0 or 1
+			Xes), the same as `epsilon(alphabet) | self`. If the initial state is
+			final then that's already the case. Otherwise the new FSM starts in a new
+			final state with the same transitions out as the old initial state. This
+			is still deterministic, so no crawl is needed. The result isn't reduced.
+		'''
+		if self.initial in self.finals:
+			return self
 
-			return frozenset(next)
+		reachable = self._reachable(sorted(self.alphabet, key=key))
+		number = dict((state, n) for (n, state) in enumerate(reachable, 1))
 
-		def final(state):
-			return any(substate in self.finals for substate in state)
+		map = {}
+		for state in reachable:
+			map[number[state]] = {}
+			if state in self.map:
+				for (symbol, next) in self.map[state].items():
+					map[number[state]][symbol] = number[next]
+		map[0] = map[1]
 
-		return crawl(alphabet, initial, final, follow) | epsilon(alphabet)
+		return fsm._trusted(
+			alphabet = self.alphabet,
+			states   = range(len(reachable) + 1),
+			initial  = 0,
+			finals   = set(number[state] for state in self.finals if state in number) | {0},
+			map      = map,
+		)
 
-	def times(self, multiplier):
+	@_cached
+	def times(self, multiplier, reduce=True):
 		'''
 			Given an FSM and a multiplier, return the multiplied FSM.
 		'''
 		if multiplier < 0:
 			raise Exception("Can't multiply an FSM by " + repr(multiplier))
+		return self.repeat(multiplier, 0, reduce=reduce)
+
+	def repeat(self, mandatory, optional, reduce=True):
+		'''
+			If the present FSM accepts X, return an FSM accepting `mandatory` Xes
+			followed by up to `optional` more, or by any number more if `optional`
+			is None. E.g. `repeat(5, 2)` accepts X{5,7} and `repeat(5, None)`
+			accepts X{5,}.
+			If no string which X accepts is a prefix of another, copies of X can
+			simply be chained together, end to start, which takes time linear in the
+			size of the result. Otherwise, the copies are concatenated by repeated
+			squaring, reducing as we go so that the intermediate FSMs stay small.
+			Either way the result is only reduced if `reduce` is True.
+		'''
+		if mandatory < 0 or (optional is not None and optional < 0):
+			raise Exception("Can't repeat an FSM " + repr((mandatory, optional)) + " times")
+
+		live = self._live()
+		if self.initial in live and self.initial not in self.finals and all(
+			self.map[state][symbol] not in live
+			for state in self.finals if state in self.map
+			for symbol in self.map[state]
+		):
+			result = self._chain(mandatory, optional)
+			if reduce:
+				result = result.reduce()
+			return result
 
-		alphabet = self.alphabet
-
-		# metastate is a set of iterations+states
-		initial = {(self.initial, 0)}
-
-		def final(state):
-			'''If the initial state is final then multiplying doesn't alter that'''
-			for (substate, iteration) in state:
-				if substate == self.initial \
-				and (self.initial in self.finals or iteration == multiplier):
-					return True
-			return False
-
-		def follow(current, symbol):
-			next = []
-			for (substate, iteration) in current:
-				if iteration < multiplier \
-				and substate in self.map \
-				and symbol in self.map[substate]:
-					next.append((self.map[substate][symbol], iteration))
-					# final of self? merge with initial on next iteration
-					if self.map[substate][symbol] in self.finals:
-						next.append((self.initial, iteration + 1))
-			if len(next) == 0:
-				raise OblivionError
-			return frozenset(next)
-
-		return crawl(alphabet, initial, final, follow).reduce()
+		mandatory = _power(self, mandatory)
+		if optional is None:
+			optional = self.star()
+		else:
+			optional = _power(self.optional(), optional)
+		return mandatory.concatenate(optional, reduce=reduce)
+
+	def _chain(self, mandatory, optional):
+		'''
+			Chain together copies of the present FSM, for `repeat()`. This requires
+			that the initial state be live and not final, and that there be no
+			transitions from a final state to a live state. Each copy consists of
+			the live non-final states, and a transition into a final state leads to
+			the first state of the next copy instead. The first state of each copy
+			has the same transitions as the initial state. It's final in each copy
+			after the first `mandatory`, and so is the state after the last copy. If
+			`optional` is None then the last copy loops back to its own first state,
+			instead.
+		'''
+		symbols = sorted(self.alphabet, key=key)
+		live = self._live()
+		inner = [
+			state for state in self._reachable(symbols)
+			if state in live and state not in self.finals
+		]
+
+		# If nothing leads back to the initial state then it can be the first
+		# state of each copy. Otherwise it mustn't be final, so we need a copy.
+		returns = any(self.initial in sources for sources in self._predecessors().values())
+		rows = []
+		if returns:
+			rows.append((0, self.initial))
+		number = dict((state, n) for (n, state) in enumerate(inner, len(rows)))
+		rows.extend((number[state], state) for state in inner)
+		width = len(rows)
+
+		if optional is None:
+			copies = mandatory + 1
+		else:
+			copies = mandatory + optional
+		size = copies * width + (0 if optional is None else 1)
+		limit = _max_states.get()
+		if limit is not None and size > limit:
+			raise BudgetError(limit, size, 0)
+
+		map = {}
+		for copy in range(copies):
+			base = copy * width
+			if optional is None and copy == copies - 1:
+				after = base
+			else:
+				after = base + width
+			for (n, state) in rows:
+				map[base + n] = transitions = {}
+				if state in self.map:
+					for symbol in symbols:
+						if symbol in self.map[state]:
+							next = self.map[state][symbol]
+							if next in number:
+								transitions[symbol] = base + number[next]
+							elif next in self.finals:
+								transitions[symbol] = after
+
+		finals = set(copy * width for copy in range(mandatory, copies))
+		if optional is not None:
+			# The state after the last copy
+			map[copies * width] = {}
+			finals.add(copies * width)
+
+		return fsm._trusted(
+			alphabet = self.alphabet,
+			states   = range(len(map)),
+			initial  = 0,
+			finals   = finals,
+			map      = map,
+		)
 
 	def __mul__(self, multiplier):
 		'''
@@ -303,13 +1655,14 @@ class fsm:
 		'''
 		return self.times(multiplier)
 
-	def union(*fsms):
+	@_cached
+	def union(*fsms, reduce=True, store=None):
 		'''
 			Treat `fsms` as a collection of arbitrary FSMs and return the union FSM.
 			Can be used as `fsm1.union(fsm2, ...)` or `fsm.union(fsm1, ...)`. `fsms`
-			may be empty.
+			may be empty. Pass a `crawlstore` as `store` to build the union on disk.
 		'''
-		return parallel(fsms, any)
+		return parallel(fsms, any, reduce=reduce, store=store)
 
 	def __or__(self, other):
 		'''
@@ -321,7 +1674,8 @@ class fsm:
 		'''
 		return self.union(other)
 
-	def intersection(*fsms):
+	@_cached
+	def intersection(*fsms, reduce=True, store=None):
 		'''
 			Intersection.
 			Take FSMs and AND them together. That is, return an FSM which
@@ -330,7 +1684,7 @@ class fsm:
 			a set intersection operation.
 			Call using "fsm3 = fsm1 & fsm2"
 		'''
-		return parallel(fsms, all)
+		return parallel(fsms, all, reduce=reduce, store=store)
 
 	def __and__(self, other):
 		'''
@@ -340,13 +1694,13 @@ class fsm:
 		'''
 		return self.intersection(other)
 
-	def symmetric_difference(*fsms):
+	def symmetric_difference(*fsms, reduce=True, store=None):
 		'''
 			Treat `fsms` as a collection of sets of strings and compute the symmetric
 			difference of them all. The python set method only allows two sets to be
 			operated on at once, but we go the extra mile since it's not too hard.
 		'''
-		return parallel(fsms, lambda accepts: (accepts.count(True) % 2) == 1)
+		return parallel(fsms, lambda accepts: (accepts.count(True) % 2) == 1, reduce=reduce, store=store)
 
 	def __xor__(self, other):
 		'''
@@ -355,62 +1709,105 @@ class fsm:
 		'''
 		return self.symmetric_difference(other)
 
-	def everythingbut(self):
+	def everythingbut(self, reduce=True):
 		'''
 			Return a finite state machine which will accept any string NOT
 			accepted by self, and will not accept any string accepted by self.
 			This is more complicated if there are missing transitions, because the
 			missing "dead" state must now be reified.
-		'''
-		alphabet = self.alphabet
-
-		initial = {0 : self.initial}
-
-		def follow(current, symbol):
-			next = {}
-			if 0 in current and current[0] in self.map and symbol in self.map[current[0]]:
-				next[0] = self.map[current[0]][symbol]
-			return next
+			Since the FSM is deterministic, it's enough to complete it with a dead
+			state and swap final and non-final states, in linear time. The reachable
+			states are numbered as `crawl()` would number them and the dead state, if
+			it's needed, comes last. The result is `reduce()`d unless `reduce` is
+			False.
+		'''
+		symbols = sorted(self.alphabet, key=key)
+		reachable = self._reachable(symbols)
+		number = dict((state, n) for (n, state) in enumerate(reachable))
+		dead = len(reachable)
+
+		row = self._rows(symbols)
+		map = {}
+		for state in reachable:
+			map[number[state]] = dict(
+				(symbol, dead if next is None else number[next])
+				for (symbol, next) in zip(symbols, row(state))
+			)
+		finals = set(n for (n, state) in enumerate(reachable) if state not in self.finals)
 
-		# state is final unless the original was
-		def final(state):
-			return not (0 in state and state[0] in self.finals)
+		if any(dead in transitions.values() for transitions in map.values()):
+			map[dead] = dict((symbol, dead) for symbol in symbols)
+			finals.add(dead)
 
-		return crawl(alphabet, initial, final, follow).reduce()
+		result = fsm._trusted(
+			alphabet = self.alphabet,
+			states   = range(len(map)),
+			initial  = 0,
+			finals   = finals,
+			map      = map,
+		)
+		if reduce:
+			result = result.reduce()
+		return result
 
-	def reversed(self):
+	def reversed(self, max_states=None):
 		'''
 			Return a new FSM such that for every string that self accepts (e.g.
-			"beer", the new FSM accepts the reversed string ("reeb").
+			"beer", the new FSM accepts the reversed string ("reeb"). This is a
+			subset construction, which can blow up exponentially, so a `budget()`
+			of `max_states` may be given.
 		'''
 		alphabet = self.alphabet
 
+		number = dict((state, n) for (n, state) in enumerate(self.states))
+
 		# Start from a composite "state-set" consisting of all final states.
 		# If there are no final states, this set is empty and we'll find that
 		# no other states get generated.
-		initial = frozenset(self.finals)
+		initial = 0
+		for state in self.finals:
+			initial |= 1 << number[state]
+
+		# Every possible way to reach each state using each symbol.
+		step = [{} for state in number]
+		for (symbol, sources) in self._predecessors().items():
+			for (state, prevs) in sources.items():
+				mask = 0
+				for prev in prevs:
+					mask |= 1 << number[prev]
+				step[number[state]][symbol] = mask
 
 		# Find every possible way to reach the current state-set
 		# using this symbol.
-		def follow(current, symbol):
-			next = frozenset([
-				prev
-				for prev in self.map
-				for state in current
-				if symbol in self.map[prev] and self.map[prev][symbol] == state
-			])
-			if len(next) == 0:
-				raise OblivionError
-			return next
+		follow = _subset_follow(step)
 
 		# A state-set is final if the initial state is in it.
 		def final(state):
-			return self.initial in state
+			return state >> number[self.initial] & 1 == 1
 
 		# Man, crawl() is the best!
-		return crawl(alphabet, initial, final, follow)
+		with budget(max_states):
+			return _crawl(alphabet, initial, final, follow)
 		# Do not reduce() the result, since reduce() calls us in turn
 
+	def _predecessors(self):
+		'''
+			Return the inverse of the transition map: a dict mapping each symbol to
+			a dict mapping each state to the set of states which transition to it on
+			that symbol.
+		'''
+		if "_predecessor_index" not in self.__dict__:
+			symbols = sorted(self.alphabet, key=key)
+			row = self._rows(symbols)
+			predecessors = {}
+			for prev in self.states:
+				for (symbol, next) in zip(symbols, row(prev)):
+					if next is not None:
+						sources = predecessors.setdefault(symbol, {})
+						sources.setdefault(next, set()).add(prev)
+			self.__dict__["_predecessor_index"] = predecessors
+		return self.__dict__["_predecessor_index"]
+
 	def __reversed__(self):
 		'''
 			Return a new FSM such that for every string that self accepts (e.g.
@@ -420,19 +1817,23 @@ class fsm:
 
 	def islive(self, state):
 		'''A state is "live" if a final state can be reached from it.'''
-		reachable = [state]
-		i = 0
-		while i < len(reachable):
-			current = reachable[i]
-			if current in self.finals:
-				return True
-			if current in self.map:
-				for symbol in self.map[current]:
-					next = self.map[current][symbol]
-					if next not in reachable:
-						reachable.append(next)
-			i += 1
-		return False
+		return state in self._live()
+
+	def _live(self):
+		'''Return the set of live states, found in one backwards search from the finals'''
+		if "_live_states" not in self.__dict__:
+			predecessors = self._predecessors()
+			live = set(self.finals)
+			stack = list(live)
+			while len(stack) > 0:
+				current = stack.pop()
+				for symbol in predecessors:
+					for prev in predecessors[symbol].get(current, ()):
+						if prev not in live:
+							live.add(prev)
+							stack.append(prev)
+			self.__dict__["_live_states"] = live
+		return self.__dict__["_live_states"]
 
 	def empty(self):
 		'''
@@ -457,7 +1858,7 @@ class fsm:
 		# Many FSMs have "dead states". Once you reach a dead state, you can no
 		# longer reach a final state. Since many strings may end up here, it's
 		# advantageous to constrain our search to live states only.
-		livestates = set(state for state in self.states if self.islive(state))
+		livestates = self._live()
 
 		# We store a list of tuples. Each tuple consists of an input string and the
 		# state that this input string leads to. This means we don't have to run the
@@ -474,12 +1875,13 @@ class fsm:
 			strings.append((cstring, cstate))
 
 		# Fixed point calculation
+		symbols = sorted(self.alphabet, key=key)
+		row = self._rows(symbols)
 		i = 0
 		while i < len(strings):
 			(cstring, cstate) = strings[i]
-			if cstate in self.map:
-				for symbol in sorted(self.map[cstate], key=key):
-					nstate = self.map[cstate][symbol]
+			for (symbol, nstate) in zip(symbols, row(cstate)):
+				if nstate is not None:
 					nstring = cstring + [symbol]
 					if nstate in livestates:
 						if nstate in self.finals:
@@ -497,9 +1899,73 @@ class fsm:
 		'''
 			Two FSMs are considered equivalent if they recognise the same strings.
 			Or, to put it another way, if their symmetric difference recognises no
-			strings.
-		'''
-		return (self ^ other).empty()
+			strings. See `distinguish()`.
+		'''
+		return self.distinguish(other) is None
+
+	def distinguish(self, other):
+		'''
+			Return a string (a list of symbols) which is recognised by exactly one
+			of these two FSMs, or None if they are equivalent. This is Hopcroft and
+			Karp's algorithm: pairs of states, one from each FSM, which must be
+			equivalent are merged in a union-find structure, and we fail as soon
+			as we merge a final state with a non-final one. No product FSM is built
+			and each state is merged at most once, so this is near-linear in the
+			sizes of the two FSMs.
+		'''
+		fsms = (self, other)
+		symbols = sorted(self.alphabet | other.alphabet, key=key)
+
+		# Which symbol to look up in each FSM, for each symbol in the combined
+		# alphabet
+		actuals = []
+		for fsm in fsms:
+			translator = fsm._translator()
+			actuals.append([translator[symbol] for symbol in symbols])
+
+		# A state of either FSM is a pair `(i, state)`. `None` stands for the
+		# oblivion state, which is non-final.
+		def final(i, state):
+			return state is not None and state in fsms[i].finals
+
+		def follow(i, state, j):
+			if state is None or state not in fsms[i].map:
+				return None
+			return fsms[i].map[state].get(actuals[i][j])
+
+		parent = {}
+		def find(x):
+			root = x
+			while root in parent:
+				root = parent[root]
+			while x != root:
+				(parent[x], x) = (root, parent[x])
+			return root
+
+		# For each pair merged, the previous pair and the symbol which led from
+		# there to here.
+		start = (self.initial, other.initial)
+		came = {start: None}
+		parent[(1, other.initial)] = (0, self.initial)
+		pairs = [start]
+		i = 0
+		while i < len(pairs):
+			pair = pairs[i]
+			i += 1
+			if final(0, pair[0]) != final(1, pair[1]):
+				string = []
+				while came[pair] is not None:
+					(pair, symbol) = came[pair]
+					string.insert(0, symbol)
+				return string
+			for j in range(len(symbols)):
+				next = (follow(0, pair[0], j), follow(1, pair[1], j))
+				roots = (find((0, next[0])), find((1, next[1])))
+				if roots[0] != roots[1]:
+					parent[roots[1]] = roots[0]
+					came[next] = (pair, symbols[j])
+					pairs.append(next)
+		return None
 
 	def __eq__(self, other):
 		'''
@@ -513,7 +1979,7 @@ class fsm:
 			Two FSMs are considered different if they have a non-empty symmetric
 			difference.
 		'''
-		return not (self ^ other).empty()
+		return self.distinguish(other) is not None
 
 	def __ne__(self, other):
 		'''
@@ -522,12 +1988,13 @@ class fsm:
 		'''
 		return self.different(other)
 
-	def difference(*fsms):
+	@_cached
+	def difference(*fsms, reduce=True, store=None):
 		'''
 			Difference. Returns an FSM which recognises only the strings
 			recognised by the first FSM in the list, but none of the others.
 		'''
-		return parallel(fsms, lambda accepts: accepts[0] and not any(accepts[1:]))
+		return parallel(fsms, lambda accepts: accepts[0] and not any(accepts[1:]), reduce=reduce, store=store)
 
 	def __sub__(self, other):
 		return self.difference(other)
@@ -537,10 +2004,11 @@ class fsm:
 			Consider the FSM as a set of strings and return the cardinality of that
 			set, or raise an OverflowError if there are infinitely many
 		'''
+		livestates = self._live()
 		num_strings = {}
 		def get_num_strings(state):
 			# Many FSMs have at least one oblivion state
-			if self.islive(state):
+			if state in livestates:
 				if state in num_strings:
 					if num_strings[state] is None: # "computing..."
 						# Recursion! There are infinitely many strings recognised
@@ -575,14 +2043,14 @@ class fsm:
 		'''
 			Treat `self` and `other` as sets of strings and see if they are disjoint
 		'''
-		return (self & other).empty()
+		return _witness(*_product([self, other], all)) is None
 
 	def issubset(self, other):
 		'''
 			Treat `self` and `other` as sets of strings and see if `self` is a subset
 			of `other`... `self` recognises no strings which `other` doesn't.
 		'''
-		return (self - other).empty()
+		return _witness(*_product([self, other], lambda accepts: accepts[0] and not accepts[1])) is None
 
 	def __le__(self, other):
 		'''
@@ -610,7 +2078,7 @@ class fsm:
 			Treat `self` and `other` as sets of strings and see if `self` is a
 			superset of `other`.
 		'''
-		return (other - self).empty()
+		return other.issubset(self)
 
 	def __ge__(self, other):
 		'''
@@ -638,6 +2106,8 @@ class fsm:
 			For completeness only, since `set.copy()` also exists. FSM objects are
 			immutable, so I can see only very odd reasons to need this.
 		'''
+		if "_table" in self.__dict__:
+			return fsm.from_dense(self.__dict__["_table"])
 		return fsm(
 			alphabet = self.alphabet,
 			states   = self.states,
@@ -670,19 +2140,288 @@ class fsm:
 				state = self.map[state][symbol]
 
 			# OK so now we have consumed that string, use the new location as the
-			# starting point.
-			return fsm(
+			# starting point. Everything but the initial state is unchanged, so the
+			# derivative can share our live states too.
+			derivative = fsm._trusted(
 				alphabet = self.alphabet,
 				states   = self.states,
 				initial  = state,
 				finals   = self.finals,
 				map      = self.map,
 			)
+			derivative.__dict__["_live_states"] = self._live()
+			return derivative
 
 		except OblivionError:
 			# Fell out of the FSM. The derivative of this FSM is the empty FSM.
 			return null(self.alphabet)
 
+class sfa:
+	'''
+		A symbolic finite automaton, for alphabets as large as all of Unicode.
+		Rather than one transition per symbol, each state has a tuple of
+		transitions `(lo, hi, next)`, meaning that every character whose code
+		point is in `range(lo, hi + 1)` leads to state `next`. The intervals of
+		each state are sorted, disjoint, and as few as possible, i.e. adjacent
+		intervals lead to different states. Characters in no interval lead to the
+		oblivion state.
+		Operations work over the coarsest partition of `range(maxunicode + 1)`
+		into intervals which all of the operands' intervals respect, treating each
+		interval of that partition as a single symbol of an ordinary `fsm`.
+		Use `fsm.to_symbolic()` and `fsm.from_symbolic()` to convert.
+	'''
+	def __setattr__(self, name, value):
+		'''Immutability prevents some potential problems.'''
+		raise Exception("This object is immutable.")
+
+	def __init__(self, states, initial, finals, map):
+		'''
+			`states`, `initial` and `finals` are as for an `fsm`. `map` maps each
+			state to an iterable of `(lo, hi, next)` transitions, which must be
+			disjoint but need not be sorted. `map` may omit states.
+		'''
+		states = set(states)
+		finals = set(finals)
+		if not initial in states:
+			raise Exception("Initial state " + repr(initial) + " must be one of " + repr(states))
+		if not finals.issubset(states):
+			raise Exception("Final states " + repr(finals) + " must be a subset of " + repr(states))
+
+		transitions = {}
+		for (state, intervals) in map.items():
+			intervals = sorted(intervals, key=lambda transition: transition[0])
+			for (lo, hi, next) in intervals:
+				if not 0 <= lo <= hi <= maxunicode:
+					raise Exception("Interval " + repr((lo, hi)) + " must be within " + repr((0, maxunicode)))
+				if not next in states:
+					raise Exception("Transition for state " + repr(state) + " and interval " + repr((lo, hi)) + " leads to " + repr(next) + ", which is not a state")
+			for (a, b) in zip(intervals, intervals[1:]):
+				if b[0] <= a[1]:
+					raise Exception("Intervals " + repr(a[:2]) + " and " + repr(b[:2]) + " of state " + repr(state) + " overlap")
+			transitions[state] = _merge(intervals)
+
+		self.__dict__["states" ] = states
+		self.__dict__["initial"] = initial
+		self.__dict__["finals" ] = finals
+		self.__dict__["map"    ] = transitions
+
+	@classmethod
+	def _trusted(cls, states, initial, finals, map):
+		'''
+			Construct an automaton from parts which are known to be valid, as
+			`fsm._trusted()` does. Each state's transitions must already be a
+			sorted tuple, as returned by `_merge()`.
+		'''
+		self = cls.__new__(cls)
+		self.__dict__["states" ] = states
+		self.__dict__["initial"] = initial
+		self.__dict__["finals" ] = finals
+		self.__dict__["map"    ] = map
+		return self
+
+	def __getattr__(self, name):
+		'''The start of every interval of each state, for `accepts()`.'''
+		if name == "_starts":
+			self.__dict__["_starts"] = dict(
+				(state, [lo for (lo, hi, next) in intervals])
+				for (state, intervals) in self.map.items()
+			)
+			return self.__dict__["_starts"]
+		raise AttributeError(name)
+
+	def __repr__(self):
+		string = "sfa("
+		string += "states = " + repr(self.states)
+		string += ", initial = " + repr(self.initial)
+		string += ", finals = " + repr(self.finals)
+		string += ", map = " + repr(self.map)
+		string += ")"
+		return string
+
+	def accepts(self, input):
+		'''Run the automaton on the supplied string of characters.'''
+		state = self.initial
+		for char in input:
+			if state not in self.map:
+				return False
+			intervals = self.map[state]
+			i = bisect_right(self._starts[state], ord(char)) - 1
+			if i < 0 or intervals[i][1] < ord(char):
+				return False
+			state = intervals[i][2]
+		return state in self.finals
+
+	def __contains__(self, string):
+		'''
+			This lets you use the syntax `"a" in sfa1` to see whether the string "a"
+			is in the set of strings accepted by `sfa1`.
+		'''
+		return self.accepts(string)
+
+	def _refinement(*sfas):
+		'''
+			Return the coarsest partition of `range(maxunicode + 1)` into intervals
+			`(lo, hi)` such that every transition of every one of these automata
+			covers whole intervals.
+		'''
+		bounds = {0, maxunicode + 1}
+		for s in sfas:
+			for intervals in s.map.values():
+				for (lo, hi, next) in intervals:
+					bounds.add(lo)
+					bounds.add(hi + 1)
+		bounds = sorted(bounds)
+		return [(lo, hi - 1) for (lo, hi) in zip(bounds, bounds[1:])]
+
+	def _classes(self, refinement):
+		'''
+			Return an equivalent `fsm` whose alphabet is the intervals of
+			`refinement`, which must respect every transition of the present
+			automaton.
+		'''
+		map = {}
+		for (state, intervals) in self.map.items():
+			map[state] = {}
+			for (lo, hi, next) in intervals:
+				i = bisect_left(refinement, (lo,))
+				while i < len(refinement) and refinement[i][1] <= hi:
+					map[state][refinement[i]] = next
+					i += 1
+		return fsm._trusted(
+			alphabet = set(refinement),
+			states   = self.states,
+			initial  = self.initial,
+			finals   = self.finals,
+			map      = map,
+		)
+
+	@classmethod
+	def _from_classes(cls, f):
+		'''
+			The inverse of `_classes()`: return an automaton equivalent to `f`,
+			whose symbols are intervals `(lo, hi)`.
+		'''
+		return cls._trusted(
+			states  = f.states,
+			initial = f.initial,
+			finals  = f.finals,
+			map     = dict(
+				(state, _merge(sorted(
+					((lo, hi, next) for ((lo, hi), next) in f.map[state].items()),
+					key=lambda transition: transition[0],
+				)))
+				for state in f.map
+			),
+		)
+
+	def reduce(self):
+		'''
+			Return an equivalent automaton with as few states as possible, which
+			are numbered as `fsm.reduce()` would number them.
+		'''
+		return _lift(fsm.reduce, [self])
+
+	def concatenate(*sfas):
+		'''
+			Concatenate arbitrarily many automata together, as
+			`fsm.concatenate()` does. The result is reduced.
+		'''
+		return _lift(fsm.concatenate, sfas)
+
+	def __add__(self, other):
+		'''Concatenate two automata.'''
+		return self.concatenate(other)
+
+	def star(self):
+		'''Return the Kleene star closure of the present automaton.'''
+		return _lift(fsm.star, [self])
+
+	def times(self, multiplier):
+		'''Return an automaton accepting `multiplier` of what self accepts.'''
+		return _lift(fsm.times, [self], multiplier=multiplier)
+
+	def __mul__(self, multiplier):
+		return self.times(multiplier)
+
+	def union(*sfas):
+		'''Accept any string accepted by any of the automata.'''
+		return _lift(fsm.union, sfas)
+
+	def __or__(self, other):
+		return self.union(other)
+
+	def intersection(*sfas):
+		'''Accept only strings accepted by all of the automata.'''
+		return _lift(fsm.intersection, sfas)
+
+	def __and__(self, other):
+		return self.intersection(other)
+
+	def difference(*sfas):
+		'''Accept strings accepted by the first automaton but none of the rest.'''
+		return _lift(fsm.difference, sfas)
+
+	def __sub__(self, other):
+		return self.difference(other)
+
+	def symmetric_difference(*sfas):
+		'''Accept strings accepted by an odd number of the automata.'''
+		return _lift(fsm.symmetric_difference, sfas)
+
+	def __xor__(self, other):
+		return self.symmetric_difference(other)
+
+	def everythingbut(self):
+		'''
+			Return an automaton accepting every string of Unicode characters
+			which the present automaton does not accept.
+		'''
+		return _lift(fsm.everythingbut, [self])
+
+	def reversed(self):
+		'''Return an automaton accepting the reverse of each string self accepts.'''
+		return _lift(fsm.reversed, [self])
+
+	def __reversed__(self):
+		return self.reversed()
+
+	def empty(self):
+		'''An automaton is empty if it accepts no strings.'''
+		return self._classes(self._refinement()).empty()
+
+	def equivalent(self, other):
+		'''Two automata are equivalent if they accept the same strings.'''
+		refinement = sfa._refinement(self, other)
+		return self._classes(refinement).equivalent(other._classes(refinement))
+
+	def __eq__(self, other):
+		return self.equivalent(other)
+
+	def __ne__(self, other):
+		return not self.equivalent(other)
+
+def _lift(method, sfas, **kwargs):
+	'''
+		Apply an `fsm` method to some `sfa`s, over their refinement, and return
+		the result as an `sfa`.
+	'''
+	refinement = sfa._refinement(*sfas)
+	fsms = [s._classes(refinement) for s in sfas]
+	return sfa._from_classes(method(*fsms, **kwargs))
+
+def _merge(intervals):
+	'''
+		Join up adjacent intervals, from a sorted list of disjoint `(lo, hi,
+		next)` transitions, which lead to the same state. Return a tuple.
+	'''
+	merged = []
+	for (lo, hi, next) in intervals:
+		if merged and merged[-1][1] + 1 == lo and merged[-1][2] == next:
+			merged[-1] = (merged[-1][0], hi, next)
+		else:
+			merged.append((lo, hi, next))
+	return tuple(merged)
+
 def null(alphabet):
 	'''
 		An FSM accepting nothing (not even the empty string). This is
@@ -712,32 +2451,58 @@ def epsilon(alphabet):
 		map      = {},
 	)
 
-def parallel(fsms, test):
+def _power(unit, n):
+	'''
+		Return an FSM accepting `n` of whatever `unit` accepts, in sequence. This
+		is computed by repeated squaring, so there are only O(log n) reduced
+		concatenations.
+	'''
+	result = epsilon(unit.alphabet)
+	while n > 0:
+		if n & 1:
+			result = result.concatenate(unit)
+		n >>= 1
+		if n > 0:
+			unit = unit.concatenate(unit)
+	return result
+
+def parallel(fsms, test, reduce=True, store=None, max_states=None):
 	'''
 		Crawl several FSMs in parallel, mapping the states of a larger meta-FSM.
 		To determine whether a state in the larger FSM is final, pass all of the
-		finality statuses (e.g. [True, False, False] to `test`.
+		finality statuses (e.g. [True, False, False] to `test`. The result is
+		`reduce()`d unless `reduce` is False.
+		If NumPy is available and every FSM keeps its transitions in a `table`,
+		the product is built a whole breadth-first level at a time, as a dense
+		FSM, instead. Either way the states are numbered identically.
+		If a `crawlstore` is supplied, the product is crawled on disk instead.
+		The product may be limited to a `budget()` of `max_states` states.
+	'''
+	with budget(max_states):
+		result = None
+		if store is None and np is not None and all("_table" in f.__dict__ for f in fsms):
+			result = _dense_product(fsms, test)
+		if result is None:
+			result = _crawl(*_product(fsms, test), store=store)
+	if reduce:
+		result = result.reduce()
+	return result
+
+def _product(fsms, test):
+	'''
+		Return the `alphabet`, `initial`, `final` and `follow` which describe the
+		product of several FSMs, ready to be `crawl()`ed or searched.
 	'''
 	alphabet = set().union(*[fsm.alphabet for fsm in fsms])
 
 	initial = dict([(i, fsm.initial) for (i, fsm) in enumerate(fsms)])
 
-	# dedicated function accepts a "superset" and returns the next "superset"
-	# obtained by following this transition in the new FSM
-	def follow(current, symbol):
-		next = {}
-		for i in range(len(fsms)):
-			if symbol not in fsms[i].alphabet and anything_else in fsms[i].alphabet:
-				actual_symbol = anything_else
-			else:
-				actual_symbol = symbol
-			if i in current \
-			and current[i] in fsms[i].map \
-			and actual_symbol in fsms[i].map[current[i]]:
-				next[i] = fsms[i].map[current[i]][actual_symbol]
-		if len(next.keys()) == 0:
-			raise OblivionError
-		return next
+	# Translate each symbol into each FSM's own alphabet by lookup, rather than
+	# by testing for `anything_else` every time
+	translators = [fsm._translator() for fsm in fsms]
+	maps = [fsm.map for fsm in fsms]
+
+	follow = _product_follow(maps, translators)
 
 	# Determine the "is final?" condition of each substate, then pass it to the
 	# test to determine finality of the overall FSM.
@@ -745,23 +2510,557 @@ def parallel(fsms, test):
 		accepts = [i in state and state[i] in fsm.finals for (i, fsm) in enumerate(fsms)]
 		return test(accepts)
 
-	return crawl(alphabet, initial, final, follow).reduce()
+	return (alphabet, initial, final, follow)
+
+class _product_follow:
+	'''
+		The `follow()` function of a product of FSMs, given their maps and
+		translators, which accepts a "superset" and returns the next "superset"
+		obtained by following this transition in the new FSM. Like
+		`_subset_follow`, this can be pickled.
+	'''
+	def __init__(self, maps, translators):
+		self.maps = maps
+		self.translators = translators
+
+	def __call__(self, current, symbol):
+		maps = self.maps
+		translators = self.translators
+		next = {}
+		for (i, substate) in current.items():
+			if substate in maps[i]:
+				row = maps[i][substate]
+				actual_symbol = translators[i][symbol]
+				if actual_symbol in row:
+					next[i] = row[actual_symbol]
+		if len(next) == 0:
+			raise OblivionError
+		return next
+
+def _dense_product(fsms, test):
+	'''
+		Build the product of several dense FSMs using NumPy, or return None if
+		there are too many possible product states to number them in 64 bits.
+		Each product state is encoded as a mixed-radix integer with one digit per
+		FSM: 0 for its oblivion state, otherwise its state number plus one. The
+		successors of a whole breadth-first level on every symbol are gathered
+		at once (or one state at a time, if the level is narrow), and new states
+		are numbered in the order they're first found, which is the order
+		`crawl()` would find them in.
+	'''
+	symbols = sorted(set().union(*[f.alphabet for f in fsms]), key=key)
+
+	tables = []
+	for f in fsms:
+		t = f.__dict__["_table"]
+		if isinstance(t, combtable):
+			t = t.expand()
+		tables.append(t)
+
+	radices = [t.size + 1 for t in tables]
+	strides = []
+	stride = 1
+	for radix in radices:
+		strides.append(stride)
+		stride *= radix
+	if stride >= 2 ** 63:
+		return None
+
+	# For each FSM, its transitions in digits, with an extra row for its
+	# oblivion state and an extra column for symbols outside its alphabet
+	steps = []
+	columns = []
+	accepting = []
+	for t in tables:
+		width = len(t.symbols)
+		step = np.zeros((t.size + 1, width + 1), dtype=np.int64)
+		step[1:, :width] = np.frombuffer(t.rows, dtype=np.intc).reshape(t.size, width) + 1
+		steps.append(step)
+		columns.append(np.array([
+			width if t.index.get(symbol, t.other) is None else t.index.get(symbol, t.other)
+			for symbol in symbols
+		], dtype=np.intp))
+		finals = np.zeros(t.size + 1, dtype=bool)
+		finals[[state + 1 for state in t.finals]] = True
+		accepting.append(finals)
+
+	def digits(codes):
+		return [(codes // s) % r for (s, r) in zip(strides, radices)]
+
+	# The same, as lists, for levels too narrow to be worth vectorising
+	step_lists = [
+		[[row[c] * s for c in column] for row in step.tolist()]
+		for (step, column, s) in zip(steps, [c.tolist() for c in columns], strides)
+	]
+	accepting_lists = [finals.tolist() for finals in accepting]
+
+	initial = sum((t.initial + 1) * s for (t, s) in zip(tables, strides))
+	frontier = [initial]
+	# The state number of every code found so far. Code 0, the oblivion state of
+	# every FSM, is numbered -1 so that it needs no special treatment. A dict
+	# costs a little per new state, whereas re-sorting an array of every code
+	# found so far would cost that much per level.
+	index = {0: -1, initial: 0}
+	size = 1
+	levels = []
+	patterns = []
+	while len(frontier) > 0:
+		if _monitors.get():
+			_check("crawl", states=size, frontier=len(frontier))
+
+		if len(frontier) < _dense_level:
+			# Too narrow to vectorise: follow each state in turn, like `crawl()`
+			new = []
+			rows = []
+			for code in frontier:
+				ds = [(code // s) % r for (s, r) in zip(strides, radices)]
+				patterns.append(sum(
+					1 << i for (i, d) in enumerate(ds) if accepting_lists[i][d]
+				))
+				for next in map(sum, zip(*[step_lists[i][d] for (i, d) in enumerate(ds)])):
+					if next not in index:
+						index[next] = size + len(new)
+						new.append(next)
+					rows.append(index[next])
+		else:
+			codes = np.array(frontier, dtype=np.int64)
+			ds = digits(codes)
+
+			# Which FSMs accept in each state, as a bitmask
+			pattern = np.zeros(len(codes), dtype=np.int64)
+			for (i, d) in enumerate(ds):
+				pattern |= accepting[i][d].astype(np.int64) << i
+			patterns.extend(pattern.tolist())
+
+			# Successors of the whole level on every symbol at once
+			next = np.zeros((len(codes), len(symbols)), dtype=np.int64)
+			for (i, d) in enumerate(ds):
+				next += steps[i][d[:, None], columns[i][None, :]] * strides[i]
+
+			# Number the successors not seen before, in order of first appearance
+			(unique, first, inverse) = np.unique(next, return_index=True, return_inverse=True)
+			unique = unique.tolist()
+			new = []
+			for u in np.argsort(first, kind="stable").tolist():
+				code = unique[u]
+				if code not in index:
+					index[code] = size + len(new)
+					new.append(code)
+
+			# The transitions of the level, in state numbers
+			numbers = np.array([index[code] for code in unique], dtype=np.intc)
+			rows = numbers[inverse.reshape(-1)]
+
+		limit = _max_states.get()
+		if limit is not None and size + len(new) > limit:
+			raise BudgetError(limit, size + len(new), size)
+		size += len(new)
+		levels.append(rows)
+		frontier = new
+
+	# Test each distinct combination of accepting FSMs only once
+	pattern = np.array(patterns, dtype=np.int64)
+	finals = np.zeros(size, dtype=bool)
+	for p in np.unique(pattern):
+		if test([(int(p) >> i) & 1 == 1 for i in range(len(fsms))]):
+			finals |= pattern == p
+
+	rows = array("i")
+	for level in levels:
+		if isinstance(level, list):
+			rows.extend(level)
+		else:
+			rows.frombytes(level.tobytes())
+	return fsm.from_dense(table(
+		symbols = symbols,
+		size    = size,
+		initial = 0,
+		finals  = np.flatnonzero(finals).tolist(),
+		rows    = rows,
+	))
+
+def _witness(alphabet, initial, final, follow):
+	'''
+		Like `crawl()`, but rather than mapping out the whole FSM, search it
+		breadth-first and stop at the first final state found. Return the
+		shortest string of symbols which leads there (or the first such string in
+		lexical order, if there are several) or None if no final state can be
+		reached.
+	'''
+	symbols = sorted(alphabet, key=key)
+
+	if final(initial):
+		return []
+
+	# For each metastate seen, the previous metastate and the symbol which led
+	# from there to here.
+	seen = {_hashable(initial): None}
+	frontier = [initial]
+	i = 0
+	while i < len(frontier):
+		if _monitors.get() and i % _check_interval == 0:
+			_check("crawl", states=len(frontier), frontier=len(frontier) - i)
+		state = frontier[i]
+		for symbol in symbols:
+			try:
+				next = follow(state, symbol)
+			except OblivionError:
+				continue
+
+			nextkey = _hashable(next)
+			if nextkey in seen:
+				continue
+			seen[nextkey] = (_hashable(state), symbol)
+
+			if final(next):
+				string = []
+				while seen[nextkey] is not None:
+					(nextkey, symbol) = seen[nextkey]
+					string.append(symbol)
+				return list(reversed(string))
+
+			frontier.append(next)
+		i += 1
+
+	return None
+
+def _hashable(metastate):
+	'''
+		`follow()` functions are free to return metastates which can't be hashed,
+		such as the dicts used by `parallel()`. Convert such a metastate into a
+		canonical hashable key which compares equal exactly when the original
+		metastates compare equal, so that `crawl()` can index it in a dict.
+	'''
+	if isinstance(metastate, dict):
+		return frozenset(metastate.items())
+	if isinstance(metastate, set):
+		return frozenset(metastate)
+	if isinstance(metastate, list):
+		return tuple(metastate)
+	return metastate
+
+class _subset_follow:
+	'''
+		A `follow()` function for a subset construction whose metastates are
+		bitsets: Python ints in which bit n is set if substate n is present.
+		`step[n]` maps each symbol to the bitset of substates reachable from
+		substate n on that symbol, so following a symbol is just an OR. This is a
+		class rather than a closure so that it can be pickled, and sent to the
+		worker processes of a parallel `crawl()`.
+	'''
+	def __init__(self, step):
+		self.step = step
+		# `crawl()` follows every symbol from the same metastate in turn, so only
+		# decode each metastate into substates once.
+		self.last = (None, [])
+
+	def __getstate__(self):
+		return {"step": self.step, "last": (None, [])}
+
+	def __call__(self, current, symbol):
+		if current is not self.last[0]:
+			substates = []
+			rest = current
+			while rest != 0:
+				low = rest & -rest
+				substates.append(low.bit_length() - 1)
+				rest ^= low
+			self.last = (current, substates)
+
+		step = self.step
+		next = 0
+		for n in self.last[1]:
+			if symbol in step[n]:
+				next |= step[n][symbol]
+		if next == 0:
+			raise OblivionError
+		return next
+
+def _serialise(metastate):
+	'''
+		Like `_hashable()`, but return a canonical byte string, which is the same
+		from one process to the next, for indexing the metastate on disk.
+	'''
+	if isinstance(metastate, dict):
+		metastate = tuple(sorted(metastate.items(), key=repr))
+	elif isinstance(metastate, (set, frozenset)):
+		metastate = tuple(sorted(metastate, key=repr))
+	elif isinstance(metastate, list):
+		metastate = tuple(metastate)
+	return repr(metastate).encode()
+
+def _crawl_stored(symbols, alphabet, initial, final, follow, store):
+	'''
+		`crawl()`, keeping the metastates and transitions in a `crawlstore`. The
+		states are numbered identically.
+	'''
+	# Identify the crawl by its alphabet, its initial metastate and where that
+	# leads, so that a store isn't resumed by some other crawl by mistake
+	successors = []
+	for symbol in symbols:
+		try:
+			successors.append(_serialise(follow(initial, symbol)))
+		except OblivionError:
+			successors.append(None)
+	fingerprint = repr((symbols, _serialise(initial), bool(final(initial)), successors)).encode()
+
+	db = store.connection
+	limit = _max_states.get()
+	row = db.execute("SELECT value FROM meta WHERE name = 'crawl'").fetchone()
+	if row is None:
+		db.execute("INSERT INTO meta VALUES ('crawl', ?)", (fingerprint,))
+		db.execute("INSERT INTO meta VALUES ('expanded', 0)")
+		db.execute("INSERT INTO states VALUES (0, ?, ?)", (_serialise(initial), pickle.dumps(initial)))
+		db.commit()
+	elif row[0] != fingerprint:
+		raise Exception(repr(store) + " holds a different crawl")
+
+	(i,) = db.execute("SELECT value FROM meta WHERE name = 'expanded'").fetchone()
+	(size,) = db.execute("SELECT COUNT(*) FROM states").fetchone()
+	# A store resumed, or loaded, under a tighter budget may already hold too
+	# many states
+	if limit is not None and size > limit:
+		raise BudgetError(limit, size, i)
+	# If anything goes wrong, go back to the last checkpoint, so that the store
+	# can be resumed
+	try:
+		while i < size:
+			if _monitors.get() and i % _check_interval == 0:
+				_check("crawl", states=size, frontier=size - i)
+			(metastate,) = db.execute("SELECT metastate FROM states WHERE number = ?", (i,)).fetchone()
+			state = pickle.loads(metastate)
+
+			nexts = {}
+			for (j, symbol) in enumerate(symbols):
+				try:
+					nexts[j] = follow(state, symbol)
+				except OblivionError:
+					continue
+			keys = dict((j, _serialise(next)) for (j, next) in nexts.items())
+
+			# Look up all of this state's successors at once, in batches small enough
+			# for SQLite, then number the new ones in order
+			found = {}
+			unique = list(set(keys.values()))
+			for start in range(0, len(unique), 500):
+				batch = unique[start:start + 500]
+				found.update(db.execute(
+					"SELECT key, number FROM states WHERE key IN (" + ", ".join("?" * len(batch)) + ")",
+					batch,
+				))
+			new = []
+			targets = array("i", [-1]) * len(symbols)
+			for (j, nextkey) in keys.items():
+				if nextkey not in found:
+					if limit is not None and size >= limit:
+						raise BudgetError(limit, size + 1, i)
+					found[nextkey] = size
+					new.append((size, nextkey, pickle.dumps(nexts[j])))
+					size += 1
+				targets[j] = found[nextkey]
+			db.executemany("INSERT INTO states VALUES (?, ?, ?)", new)
+
+			db.execute("INSERT INTO rows VALUES (?, ?, ?)", (i, bool(final(state)), targets.tobytes()))
+			i += 1
+			if i % store.checkpoint == 0:
+				db.execute("UPDATE meta SET value = ? WHERE name = 'expanded'", (i,))
+				db.commit()
+	except BaseException:
+		db.rollback()
+		raise
+
+	db.execute("UPDATE meta SET value = ? WHERE name = 'expanded'", (i,))
+	db.commit()
+
+	rows = array("i")
+	for (targets,) in db.execute("SELECT targets FROM rows ORDER BY number"):
+		rows.frombytes(targets)
+	result = fsm.from_dense(table(
+		symbols = symbols,
+		size    = size,
+		initial = 0,
+		finals  = [n for (n,) in db.execute("SELECT number FROM rows WHERE final")],
+		rows    = rows,
+	))
+	result.__dict__["alphabet"] = alphabet
+	return result
+
+# In a worker process of `_crawl_parallel()`: the number of the crawl it
+# last worked on, and that crawl's `follow()` function and symbols
+_worker = None
+
+# Numbers for parallel crawls, so that worker processes can tell them apart
+_crawl_numbers = count()
+
+def _expand(follow, symbols, states):
+	'''
+		Follow every symbol from each of these states. Return the distinct
+		successors, and for each state a list of pairs `(j, u)`, meaning that
+		symbol `j` leads to successor `u`. Sending each successor back from a
+		worker process only once saves a lot of pickling.
+	'''
+	successors = []
+	index = {}
+	rows = []
+	for state in states:
+		row = []
+		for (j, symbol) in enumerate(symbols):
+			try:
+				next = follow(state, symbol)
+			except OblivionError:
+				continue
+			nextkey = _hashable(next)
+			if nextkey not in index:
+				index[nextkey] = len(successors)
+				successors.append(next)
+			row.append((j, index[nextkey]))
+		rows.append(row)
+	return (successors, rows)
+
+def _expand_in_worker(number, task, states):
+	'''
+		`_expand()`, in a worker process, for the crawl numbered `number`, whose
+		`follow()` function and symbols are pickled in `task`. They are only
+		unpickled the first time this process works on that crawl.
+	'''
+	global _worker
+	if _worker is None or _worker[0] != number:
+		_worker = None
+		_worker = (number,) + pickle.loads(task)
+	return _expand(_worker[1], _worker[2], states)
+
+def _executor(workers):
+	'''The process pool for parallel crawls with this many workers'''
+	from concurrent.futures import ProcessPoolExecutor
+	with _executors_lock:
+		if workers not in _executors:
+			_executors[workers] = ProcessPoolExecutor(max_workers = workers)
+		return _executors[workers]
+
+def _crawl_parallel(symbols, alphabet, initial, final, follow, workers):
+	'''
+		`crawl()` one breadth-first level at a time, sharing the `follow()`
+		calls of each large level out among `workers` processes, in chunks. The
+		results are merged in the order of the level's states, then of the
+		symbols, which is the order in which `crawl()` would find new states, so
+		they are numbered identically. The budget is checked as each chunk is
+		merged, and any `monitor()`s every 1000 states, as `crawl()` does.
+	'''
+	from concurrent.futures.process import BrokenProcessPool
+
+	limit = _max_states.get()
+	states = [initial]
+	index = {_hashable(initial): 0}
+	finals = set()
+	map = {}
 
-def crawl(alphabet, initial, final, follow):
+	number = next(_crawl_numbers)
+	task = None
+	next_check = 0
+	start = 0
+	while start < len(states):
+		level = states[start:]
+		futures = []
+		try:
+			if len(level) < _parallel_level:
+				batches = [_expand(follow, symbols, level)]
+			else:
+				if task is None:
+					task = pickle.dumps((follow, symbols))
+				executor = _executor(workers)
+				size = -(-len(level) // (workers * 4))
+				futures = [
+					executor.submit(_expand_in_worker, number, task, level[i:i + size])
+					for i in range(0, len(level), size)
+				]
+				batches = (future.result() for future in futures)
+
+			i = start
+			for (successors, rows) in batches:
+				# Check as often as `_crawl()` does, however the level is divided
+				if _monitors.get() and i >= next_check:
+					_check("crawl", states=len(states), frontier=len(states) - i)
+					next_check = (i // _check_interval + 1) * _check_interval
+				numbers = []
+				for successor in successors:
+					nextkey = _hashable(successor)
+					if nextkey not in index:
+						if len(states) == limit:
+							raise BudgetError(limit, len(states) + 1, i)
+						index[nextkey] = len(states)
+						states.append(successor)
+					numbers.append(index[nextkey])
+				for row in rows:
+					if final(states[i]):
+						finals.add(i)
+					map[i] = dict((symbols[j], numbers[u]) for (j, u) in row)
+					i += 1
+		except BrokenProcessPool:
+			# Start a new pool next time
+			with _executors_lock:
+				_executors.pop(workers, None)
+			raise
+		finally:
+			# Don't leave the pool working on chunks nobody will merge
+			for future in futures:
+				future.cancel()
+		start += len(level)
+
+	return fsm._trusted(
+		alphabet = alphabet,
+		states   = range(len(states)),
+		initial  = 0,
+		finals   = finals,
+		map      = map,
+	)
+
+def crawl(alphabet, initial, final, follow, store=None, workers=None, max_states=None):
 	'''
 		Given the above conditions and instructions, crawl a new unknown FSM,
 		mapping its states, final states and transitions. Return the new FSM.
 		This is a pretty powerful procedure which could potentially go on
 		forever if you supply an evil version of follow().
+		If a `crawlstore` is supplied, the crawl is kept on disk (and resumed
+		from there, if it was interrupted) and the new FSM is dense.
+		If `workers` (by default, the number set by `use_workers()`) is more
+		than 1, large breadth-first levels are followed in that many processes,
+		so `follow` must be picklable. The states are numbered identically.
+		If the new FSM would have more than `max_states` states, or more than
+		the current `budget()` allows, stop with a `BudgetError`.
+	'''
+	with budget(max_states):
+		# Copy the alphabet, so that the caller can't change the new FSM's
+		return _crawl(set(alphabet), initial, final, follow, store, workers)
+
+def _crawl(alphabet, initial, final, follow, store=None, workers=None):
 	'''
+		`crawl()`, within the current budget. The new FSM takes `alphabet`, which
+		must be a set, as its own, so this is only for alphabets nobody else can
+		change, such as a new set or another FSM's alphabet.
+	'''
+
+	# Sorting the alphabet once up front keeps the state numbering stable
+	# without paying for a sort at every state.
+	symbols = sorted(alphabet, key=key)
+
+	if store is not None:
+		return _crawl_stored(symbols, alphabet, initial, final, follow, store)
+	if workers is None:
+		workers = _workers.get()
+	if workers > 1:
+		return _crawl_parallel(symbols, alphabet, initial, final, follow, workers)
 
+	limit = _max_states.get()
 	states = [initial]
+	index = {_hashable(initial): 0}
 	finals = set()
 	map = {}
 
 	# iterate over a growing list
 	i = 0
 	while i < len(states):
+		if _monitors.get() and i % _check_interval == 0:
+			_check("crawl", states=len(states), frontier=len(states) - i)
 		state = states[i]
 
 		# add to finals
@@ -770,25 +3069,30 @@ def crawl(alphabet, initial, final, follow):
 
 		# compute map for this state
 		map[i] = {}
-		for symbol in sorted(alphabet, key=key):
+		for symbol in symbols:
 			try:
 				next = follow(state, symbol)
-
-				try:
-					j = states.index(next)
-				except ValueError:
-					j = len(states)
-					states.append(next)
-
 			except OblivionError:
 				# Reached an oblivion state. Don't list it.
 				continue
 
+			# Look up the metastate by hash rather than scanning every metastate
+			# seen so far.
+			nextkey = _hashable(next)
+			if nextkey in index:
+				j = index[nextkey]
+			else:
+				j = len(states)
+				if j == limit:
+					raise BudgetError(limit, j + 1, i)
+				states.append(next)
+				index[nextkey] = j
+
 			map[i][symbol] = j
 
 		i += 1
 
-	return fsm(
+	return fsm._trusted(
 		alphabet = alphabet,
 		states   = range(len(states)),
 		initial  = 0,
@@ -4,7 +4,7 @@ if __name__ == "__main__":
 	raise Exception("Test files can't be run directly. Use `python -m pytest greenery`")
 
 import pytest
-from greenery.fsm import fsm, null, epsilon, anything_else
+from greenery.fsm import fsm, null, epsilon, anything_else, crawl, table, opcache, use_cache, sfa, maxunicode, crawlstore, OblivionError, use_workers, budget, BudgetError, monitor, cancellation, CancelledError
 
 def test_addbug():
 	# Odd bug with fsm.__add__(), exposed by "[bc]*c"
@@ -708,3 +708,929 @@ def test_bug_36():
 	assert etc2.accepts(["s"])
 	assert both.alphabet == {anything_else, "s"}
 	assert both.accepts(["s"])
+
+def test_crawl_unhashable_metastates():
+	# `follow()` may return dicts, which can't be hashed. Equal metastates must
+	# still be merged into a single state, numbered in order of discovery.
+	def follow(current, symbol):
+		return {"count": (current["count"] + 1) % 3}
+	def final(state):
+		return state == {"count": 0}
+	counter = crawl({"a"}, {"count": 0}, final, follow)
+	assert counter.states == {0, 1, 2}
+	assert counter.finals == {0}
+	assert counter.map == {0: {"a": 1}, 1: {"a": 2}, 2: {"a": 0}}
+	assert counter.accepts("aaa")
+	assert not counter.accepts("aa")
+
+def test_reduce_methods(a, b):
+	# Hopcroft and Brzozowski minimisation both number states by crawling from
+	# the initial state, so they should agree exactly, dead states and all.
+	brzozowski = fsm(
+		alphabet = {"a", "b", anything_else},
+		states   = {"A", "B", "C", "D", "E", "F", "G"},
+		initial  = "A",
+		finals   = {"C", "E"},
+		map      = {
+			"A" : {"a" : "B", "b" : "D", anything_else : "G"},
+			"B" : {"a" : "C", "b" : "E"},
+			"C" : {"a" : "C", "b" : "E"},
+			"D" : {"a" : "B", "b" : "D"},
+			"E" : {"a" : "B", "b" : "D"},
+			"F" : {"a" : "A"},
+			"G" : {"a" : "G", anything_else : "G"},
+		},
+	)
+	for f in [a, b, a | b, a + b, a.star(), brzozowski, null({"a"}), epsilon({"a"})]:
+		hopcroft = f.reduce(method="hopcroft")
+		assert hopcroft.map == f.reduce(method="brzozowski").map
+		assert hopcroft.finals == f.reduce(method="brzozowski").finals
+	assert brzozowski.reduce().map == {
+		0 : {"a" : 1, "b" : 0},
+		1 : {"a" : 2, "b" : 3},
+		2 : {"a" : 2, "b" : 3},
+		3 : {"a" : 1, "b" : 0},
+	}
+	with pytest.raises(Exception):
+		a.reduce(method="moore")
+
+def test_reverse_predecessors():
+	# The predecessor index is built once and reused by every reversal
+	abc = fsm(
+		alphabet = {"a", "b", "c"},
+		states   = {0, 1, 2, 3},
+		initial  = 0,
+		finals   = {3},
+		map      = {
+			0 : {"a" : 1, "b" : 1},
+			1 : {"b" : 2},
+			2 : {"c" : 3, "a" : 0},
+		},
+	)
+	predecessors = abc._predecessors()
+	assert predecessors == {
+		"a" : {1 : {0}, 0 : {2}},
+		"b" : {1 : {0}, 2 : {1}},
+		"c" : {3 : {2}},
+	}
+	assert abc._predecessors() is predecessors
+	cba = reversed(abc)
+	assert cba.accepts("cba")
+	assert cba.accepts("cbb")
+	assert cba.accepts("cbbaba")
+	assert not cba.accepts("abc")
+	assert reversed(cba).equivalent(abc)
+
+def test_dense(a):
+	dense = a.to_dense()
+	assert dense.symbols == ("a", "b")
+	assert dense.size == 3
+	assert dense.initial == 0
+	assert dense.finals == {1}
+	assert list(dense.rows) == [1, 2, 2, 2, 2, 2]
+	assert dense.follow(0, "a") == 1
+	assert dense.follow(0, "c") == -1
+
+	a2 = fsm.from_dense(dense)
+	assert a2.to_dense() is dense
+	assert "map" not in a2.__dict__
+	assert a2.accepts("a")
+	assert not a2.accepts("b")
+	assert not a2.accepts("c")
+	assert "map" not in a2.__dict__
+	assert a2.map == {0 : {"a" : 1, "b" : 2}, 1 : {"a" : 2, "b" : 2}, 2 : {"a" : 2, "b" : 2}}
+	assert a2.states == {0, 1, 2}
+	assert a2 == a
+	assert (a2 + a2).accepts("aa")
+
+	# Algorithms which walk the transitions read the table directly, with the
+	# same results as from the map
+	f = (a + a.star()).union(a.everythingbut(), reduce = False)
+	for g in [fsm.from_dense(f.to_dense()), fsm.from_dense(f.to_dense().compress())]:
+		assert "map" not in g.__dict__
+		assert g._reachable(["a", "b"]) == f._reachable(["a", "b"])
+		assert g._predecessors() == f._predecessors()
+		assert g.reduce().map == f.reduce().map
+		assert g.everythingbut(reduce = False).map == f.everythingbut(reduce = False).map
+		assert list(zip(range(10), g.strings())) == list(zip(range(10), f.strings()))
+		assert "map" not in g.__dict__
+
+def test_dense_anything_else():
+	blockquote = fsm(
+		alphabet = {"/", "*", anything_else},
+		states = {0, 1, 2, 3, 4, 5},
+		initial = 0,
+		finals = {4},
+		map = {
+				0 : {"/" : 1},
+				1 : {"*" : 2},
+				2 : {"/" : 2, anything_else : 2, "*" : 3},
+				3 : {"/" : 4, anything_else : 2, "*" : 3},
+		}
+	)
+	dense = blockquote.to_dense()
+	assert dense.symbols == ("*", "/", anything_else)
+	assert dense.rows[0:3].tolist() == [-1, 1, -1]
+	assert dense.follow(2, "whatever") == 2
+	assert dense.accepts(["/", "*", "whatever", "*", "/"])
+	assert fsm.from_dense(dense).map == {
+		0 : {"/" : 1},
+		1 : {"*" : 2},
+		2 : {"/" : 2, anything_else : 2, "*" : 3},
+		3 : {"/" : 4, anything_else : 2, "*" : 3},
+		4 : {},
+		5 : {},
+	}
+
+def test_dense_renumbering(b):
+	# Non-integer states are renumbered by crawling from the initial state
+	unreachable = fsm(
+		alphabet = {"a"},
+		states   = {"x", "y", "z"},
+		initial  = "y",
+		finals   = {"x"},
+		map      = {"x" : {"a" : "y"}, "y" : {"a" : "x"}},
+	)
+	dense = unreachable.to_dense()
+	assert dense.initial == 0
+	assert dense.finals == {1}
+	assert list(dense.rows) == [1, 0, -1]
+	assert fsm.from_dense(dense).accepts("aaa")
+
+def test_invalid_dense():
+	with pytest.raises(Exception):
+		table(symbols = "ab", size = 2, initial = 0, finals = [], rows = [0, 1, 1])
+	with pytest.raises(Exception):
+		table(symbols = "ab", size = 2, initial = 2, finals = [], rows = [0, 1, 1, 1])
+	with pytest.raises(Exception):
+		table(symbols = "ab", size = 2, initial = 0, finals = [3], rows = [0, 1, 1, 1])
+	with pytest.raises(Exception):
+		table(symbols = "ab", size = 2, initial = 0, finals = [], rows = [0, 1, 2, 1])
+
+def test_combtable():
+	# Most states of a complement send almost every symbol to the same place
+	a = fsm(
+		alphabet = {"a", "b", "c", "d", anything_else},
+		states   = {0, 1},
+		initial  = 0,
+		finals   = {1},
+		map      = {0 : {"a" : 1}},
+	)
+	dense = a.everythingbut().to_dense()
+	assert dense.symbols == ("a", "b", "c", "d", anything_else)
+	assert list(dense.rows) == [1, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2]
+	comb = dense.compress()
+	assert list(comb.default) == [2, 2, 2]
+	assert list(comb.base) == [0, 0, 0]
+	assert list(comb.next) == [1]
+	assert list(comb.check) == [0]
+	assert comb.compress() is comb
+	assert comb.expand().rows == dense.rows
+	for state in range(3):
+		for j in range(5):
+			assert comb.target(state, j) == dense.target(state, j)
+
+	notA = fsm.from_dense(comb)
+	assert notA.accepts("")
+	assert not notA.accepts("a")
+	assert notA.accepts("b")
+	assert notA.accepts(["whatever"])
+	assert notA.accepts("aa")
+	assert notA.map[0]["b"] == 2
+	assert "map" in notA.__dict__
+	assert notA.map == a.everythingbut().map
+	assert notA == a.everythingbut()
+	assert str(notA) == str(a.everythingbut())
+
+def test_combtable_packing():
+	# Two states whose exceptions interleave should share the comb vector
+	dense = table(
+		symbols = "abcd",
+		size    = 2,
+		initial = 0,
+		finals  = [1],
+		rows    = [1, 0, 1, 0, 0, 1, 0, 1],
+	)
+	comb = dense.compress()
+	assert list(comb.default) == [1, 0]
+	assert list(comb.next) == [0, 1, 0, 1]
+	assert list(comb.check) == [0, 1, 0, 1]
+	assert comb.expand().rows == dense.rows
+
+def test_dense_serialisation():
+	import pickle
+	from array import array
+	from greenery.fsm import combtable
+	notA = fsm.from_dense(null({"a", "b"}).to_dense().compress())
+	assert "map" not in pickle.loads(pickle.dumps(notA)).__dict__
+	assert pickle.loads(pickle.dumps(notA)).to_dense().default == array("i", [0])
+	assert eval(repr(notA)).to_dense().default == array("i", [0])
+
+def test_subset_follow():
+	# Metastates of subset constructions are bitsets over numbered substates
+	from greenery.fsm import _subset_follow, OblivionError
+	follow = _subset_follow([
+		{"a" : 0b010},
+		{"a" : 0b001, "b" : 0b110},
+		{},
+	])
+	assert follow(0b011, "a") == 0b011
+	assert follow(0b011, "b") == 0b110
+	assert follow(0b010, "b") == 0b110
+	with pytest.raises(OblivionError):
+		follow(0b001, "b")
+	with pytest.raises(OblivionError):
+		follow(0b100, "a")
+	with pytest.raises(OblivionError):
+		follow(0, "a")
+
+def test_lazy_predicates(a, b):
+	from greenery.fsm import _witness, _product
+	# The shortest string in the symmetric difference, found without building
+	# or minimising the product
+	xor = lambda accepts: accepts[0] != accepts[1]
+	assert _witness(*_product([a.star(), b.star()], xor)) == ["a"]
+	assert _witness(*_product([a * 3, a * 2], xor)) == ["a", "a"]
+	assert _witness(*_product([a.star(), (a * 2).star()], xor)) == ["a"]
+	assert _witness(*_product([(a * 2).star(), (a * 2).star() + a * 2], xor)) == []
+	assert _witness(*_product([a.star(), a.star()], xor)) is None
+
+	assert a.isdisjoint(b)
+	assert not a.isdisjoint(a | b)
+	assert a.issubset(a | b)
+	assert not (a | b).issubset(a)
+	assert (a | b).issuperset(b)
+	assert not b.issuperset(a | b)
+	assert (a * 2).star().equivalent(epsilon({"a"}) | (a * 2).star() + a * 2)
+	assert (a * 2).star().different(a.star())
+
+def test_distinguish(a, b):
+	# Hopcroft-Karp never needs the FSMs to be minimal or share an alphabet
+	assert a.star().distinguish((a * 2).star() | a * 3 + a.star() | a) is None
+	assert a.star().distinguish(a.star() + a) == []
+	assert (a | b).distinguish(a) == ["b"]
+	assert (a * 3).distinguish(a * 3 | a * 5) == ["a"] * 5
+	blockbuster = fsm(
+		alphabet = {"a", anything_else},
+		states = {0, 1},
+		initial = 0,
+		finals = {1},
+		map = {0: {"a": 1, anything_else: 1}},
+	)
+	assert blockbuster.distinguish(blockbuster.reduce()) is None
+	assert blockbuster.distinguish(a | b) == [anything_else]
+	string = blockbuster.distinguish(a)
+	assert string == ["b"]
+	assert blockbuster.accepts(string) != a.accepts(string)
+
+def test_live_cache(a):
+	# A long chain of states, the last of which is final
+	n = 500
+	chain = fsm(
+		alphabet = {"a", "b"},
+		states = set(range(n + 1)),
+		initial = 0,
+		finals = {n - 1},
+		map = dict((i, {"a": i + 1, "b": n}) for i in range(n)),
+	)
+	assert chain.islive(0)
+	assert not chain.islive(n)
+	assert chain._live() == set(range(n))
+	assert chain.cardinality() == 1
+	assert list(chain.strings()) == [["a"] * (n - 1)]
+
+	derivative = chain.derive(["a"] * 5)
+	assert derivative.__dict__["_live_states"] is chain._live()
+	assert derivative.cardinality() == 1
+	assert chain.derive(["b"]).empty()
+	assert a.derive(["b"]).empty()
+
+def test_trusted(a):
+	import pickle
+	# crawl() output skips validation and only materialises `states` on demand
+	crawled = a * 2
+	assert "states" not in crawled.__dict__
+	assert crawled.states == {0, 1, 2}
+	assert "states" in crawled.__dict__
+	assert pickle.loads(pickle.dumps(a * 2)).states == {0, 1, 2}
+
+	# The public constructor still validates
+	with pytest.raises(Exception):
+		fsm(alphabet = {"a"}, states = {0}, initial = 0, finals = set(), map = {0: {"a": 1}})
+
+	# crawl() doesn't share the caller's alphabet, which they might change later
+	alphabet = {"a"}
+	crawled = crawl(alphabet, 0, lambda state: state == 1, lambda state, symbol: 1)
+	alphabet.add("b")
+	assert crawled.alphabet == {"a"}
+
+def test_minimal_flag(a, b):
+	import pickle
+	# Reducing a reduced FSM, or the result of an operation which reduces, is free
+	reduced = (a | b).reduce()
+	assert reduced.reduce() is reduced
+	assert reduced.reduce(method="brzozowski") is reduced
+	for f in [a + b, a * 3, a | b, a & b, a.star().reduce()]:
+		assert f.reduce() is f
+	assert pickle.loads(pickle.dumps(reduced)).__dict__.get("_minimal")
+
+	# An FSM built by hand is never assumed to be minimal
+	assert a.reduce() is not a
+	assert a.reduce().map == a.reduce().reduce().map
+	with pytest.raises(Exception):
+		reduced.reduce(method="moore")
+
+def test_direct_constructions(a, b):
+	# everythingbut() completes the FSM and swaps finals, then reduces it
+	notA = a.everythingbut(reduce = False)
+	assert notA.map == {
+		0 : {"a" : 1, "b" : 2},
+		1 : {"a" : 2, "b" : 2},
+		2 : {"a" : 2, "b" : 2},
+	}
+	assert notA.finals == {0, 2}
+	assert notA.everythingbut() == a
+	assert len(null({"a"}).everythingbut().states) == 1
+	assert notA.reduce().map == a.everythingbut().map
+	unreduced = fsm(
+		alphabet = {"a"},
+		states   = {0, 1, 2},
+		initial  = 0,
+		finals   = {1, 2},
+		map      = {0 : {"a" : 1}, 1 : {"a" : 2}, 2 : {"a" : 2}},
+	)
+	assert len(unreduced.everythingbut(reduce = False).states) == 3
+	assert len(unreduced.everythingbut().states) == 1
+	assert (a | b).everythingbut() == a.everythingbut() & b.everythingbut()
+
+	# star() no longer needs a union with epsilon()
+	for f in [a, a + b, (a + b).optional(), a.everythingbut()]:
+		assert f.star() == (f.star() | epsilon(f.alphabet))
+	assert a.star().accepts("")
+	assert a.star().accepts("aaa")
+	assert not (a + b).star().accepts("aba")
+	assert (a + b).star().accepts("abab")
+
+	# optional() is a deterministic copy with a new initial state
+	unit = a + b
+	assert unit.optional() == epsilon(unit.alphabet) | unit
+	optional = unit.optional()
+	assert optional.map[0] == optional.map[1]
+	assert optional.optional() is optional
+	astar = a.star()
+	assert astar.optional() is astar
+
+def test_deferred_reduce(a, b):
+	# Every operation can skip minimisation, leaving it for the end
+	for (eager, deferred) in [
+		(a + b, a.concatenate(b, reduce=False)),
+		(a * 3, a.times(3, reduce=False)),
+		(a.star(), a.star(reduce=False)),
+		(a | b, a.union(b, reduce=False)),
+		(a & b, a.intersection(b, reduce=False)),
+		(a ^ b, a.symmetric_difference(b, reduce=False)),
+		(a - b, a.difference(b, reduce=False)),
+	]:
+		assert "_minimal" in eager.__dict__
+		assert "_minimal" not in deferred.__dict__
+		assert deferred.reduce().map == eager.map
+		assert deferred.reduce().finals == eager.finals
+
+	# A chain of deferred operations, reduced once
+	chain = a.concatenate(b, reduce=False).union(a, reduce=False).star(reduce=False)
+	assert len(chain.states) > len(chain.reduce().states)
+	assert chain.reduce().map == ((a + b) | a).star().map
+
+def test_repeat(a, b):
+	# Prefix-free units are chained together directly
+	ab = a + b
+	assert ab.repeat(2, 1).accepts("abab")
+	assert ab.repeat(2, 1).accepts("ababab")
+	assert not ab.repeat(2, 1).accepts("ab")
+	assert not ab.repeat(2, 1).accepts("abababab")
+	assert ab.repeat(2, None).accepts("ab" * 10)
+	assert not ab.repeat(2, None).accepts("ab" * 10 + "a")
+	assert ab.repeat(0, 0) == epsilon(ab.alphabet)
+	assert ab.repeat(1, 0) == ab
+	assert len(a.repeat(1000, 0).states) == 1001
+	assert len(a.repeat(500, 500).states) == 1001
+
+	# ...even if the initial state can be returned to, as in "b*a"
+	bstara = b.star() + a
+	assert not bstara.repeat(0, None).accepts("b")
+	assert bstara.repeat(0, None) == bstara.star()
+	assert bstara.repeat(2, 2) == bstara * 2 + (epsilon(a.alphabet) | bstara) * 2
+
+	# Other units are concatenated by repeated squaring
+	astar = a.star()
+	assert astar.repeat(3, 2) == astar
+	abstar = a + b.star()
+	assert abstar.repeat(0, 3) == (epsilon(a.alphabet) | abstar) * 3
+	assert not abstar.repeat(0, 3).accepts("abaaba")
+	assert (a | ab).repeat(3, None) == (a | ab) * 3 + (a | ab).star()
+	assert (a | ab).repeat(7, 0) == (a | ab) * 7
+	# ...but the result is only reduced if asked
+	unreduced = (a | a + a).times(3, reduce = False)
+	assert "_minimal" not in unreduced.__dict__
+	assert unreduced == (a | a + a) * 3
+
+	with pytest.raises(Exception):
+		a.repeat(-1, 0)
+	with pytest.raises(Exception):
+		a.repeat(0, -1)
+
+def test_translator(a):
+	# Each FSM translates foreign symbols into its own alphabet by lookup
+	translator = a._translator()
+	assert a._translator() is translator
+	assert translator["a"] == "a"
+	assert translator["z"] == "z"
+	other = fsm(
+		alphabet = {"a", anything_else},
+		states   = {0, 1},
+		initial  = 0,
+		finals   = {1},
+		map      = {0: {"a": 0, anything_else: 1}},
+	)
+	translator = other._translator()
+	assert translator["a"] == "a"
+	assert translator["z"] is anything_else
+	assert translator[anything_else] is anything_else
+	assert other.accepts("aaz")
+	assert not other.accepts("za")
+
+	# Products look up each symbol of the combined alphabet in each FSM
+	assert (a & other).empty()
+	assert (a | other).accepts("b")
+	assert (other - a).accepts("ab")
+	assert not (other - a).accepts("a")
+
+def test_canonical_hash(a, b):
+	# Equivalent FSMs have the same canonical form and hash
+	assert (a | b).canonical() == (b | a).canonical()
+	assert (a | b).canonical() == (a | b | a).reduce(method="brzozowski").canonical()
+	assert (a | b).canonical() != (a + b).canonical()
+	assert hash(a.star()) == hash((a * 2).star() | a * 3 + a.star() | a)
+
+	# ...even if their alphabets differ, since `==` doesn't care about that
+	blockbuster = fsm(
+		alphabet = {"a", anything_else},
+		states = {0, 1},
+		initial = 0,
+		finals = {1},
+		map = {0: {"a": 1, anything_else: 1}},
+	)
+	bigger = fsm(
+		alphabet = {"a", "b", "c", anything_else},
+		states = {0, 1},
+		initial = 0,
+		finals = {1},
+		map = {0: {"a": 1, "b": 1, "c": 1, anything_else: 1}},
+	)
+	assert blockbuster == bigger
+	assert hash(blockbuster) == hash(bigger)
+	assert blockbuster.canonical() != bigger.canonical()
+	assert hash(a) == hash(fsm(alphabet = {"a"}, states = {0, 1}, initial = 0, finals = {1}, map = {0: {"a": 1}}))
+
+	# So FSMs can be dictionary keys
+	languages = {a: "a", a | b: "a|b"}
+	assert languages[(b | a).reduce()] == "a|b"
+	assert languages[a + epsilon({"a"})] == "a"
+	assert len({a, a.reduce(), a * 1, b}) == 2
+
+def test_opcache(a, b):
+	cache = opcache(maxsize = 2)
+	assert use_cache(cache) is None
+	try:
+		union = a | b
+		assert (cache.hits, cache.misses) == (0, 1)
+		# Operands are keyed by canonical form, so equivalent FSMs hit
+		assert a.reduce() | b.reduce() is union
+		assert (cache.hits, cache.misses) == (1, 1)
+		# Unreduced calls bypass the cache, and don't reduce their operands
+		assert a.union(b, reduce=False) is not union
+		assert (cache.hits, cache.misses) == (1, 1)
+		assert "_minimal" not in a.union(b, reduce=False).__dict__
+		assert a * 3 is a * 3
+		assert a + b is a + b
+		assert a & b is a & b
+		assert a - b is a - b
+		assert len(cache) == 2
+		# The least recently used results were discarded
+		assert a | b is not union
+	finally:
+		assert use_cache(None) is cache
+	assert (a | b) is not union
+	cache.clear()
+	assert (len(cache), cache.hits, cache.misses) == (0, 0, 0)
+
+def test_opcache_threads(a, b):
+	# Threads can share one cache, even while its results are being evicted,
+	# and each thread chooses its own cache
+	import threading
+	cache = opcache(maxsize = 1)
+	assert use_cache(cache) is None
+	try:
+		errors = []
+		previous = []
+		def run():
+			previous.append(use_cache(cache))
+			try:
+				for i in range(50):
+					assert (a | b) == (a | b)
+					assert (a & b).empty()
+			except Exception as e:
+				errors.append(e)
+		threads = [threading.Thread(target = run) for i in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		assert errors == []
+		assert previous == [None] * 4
+		assert cache.hits + cache.misses == 4 * 50 * 3
+	finally:
+		assert use_cache(None) is cache
+
+def test_compress_alphabet():
+	# "b" and "c" behave identically everywhere, as do "d" and anything_else
+	f = fsm(
+		alphabet = {"a", "b", "c", "d", anything_else},
+		states   = {0, 1, 2},
+		initial  = 0,
+		finals   = {1},
+		map      = {
+			0: {"a": 1, "b": 2, "c": 2, "d": 0, anything_else: 0},
+			1: {"a": 1, "b": 0, "c": 0, "d": 2, anything_else: 2},
+			2: {"a": 2, "b": 2, "c": 2, "d": 2, anything_else: 2},
+		},
+	)
+	(compressed, classes) = f.compress_alphabet()
+	assert classes == {"a": "a", "b": "b", "c": "b", "d": "d", anything_else: "d"}
+	assert compressed.alphabet == {"a", "b", "d"}
+	assert compressed.accepts("da")
+	assert not compressed.accepts("ab")
+
+	expanded = compressed.expand_alphabet(classes)
+	assert expanded.alphabet == f.alphabet
+	assert expanded == f
+	assert expanded.accepts("ea")
+	assert expanded.accepts("aca")
+
+	# Minimal FSMs stay minimal, numbered just as reduce() numbers them
+	reduced = compressed.reduce().expand_alphabet(classes)
+	assert reduced.reduce() is reduced
+	assert reduced.map == f.reduce().map
+
+def test_symbolic(a, b):
+	# Any CJK ideograph, then any number of anything
+	cjk = sfa(
+		states  = {0, 1},
+		initial = 0,
+		finals  = {1},
+		map     = {0: [(0x4e00, 0x9fff, 1)], 1: [(0, 0x4dff, 1), (0x4e00, maxunicode, 1)]},
+	)
+	assert cjk.map == {0: ((0x4e00, 0x9fff, 1),), 1: ((0, maxunicode, 1),)}
+	assert cjk.accepts("一a")
+	assert not cjk.accepts("a一")
+	assert not cjk.accepts("")
+	with pytest.raises(Exception):
+		sfa(states = {0}, initial = 0, finals = set(), map = {0: [(0, 5, 0), (5, 9, 0)]})
+
+	# Ending with a lowercase letter
+	lower = sfa(
+		states  = {0, 1},
+		initial = 0,
+		finals  = {1},
+		map     = {0: [(0, 0x60, 0), (0x61, 0x7a, 1), (0x7b, maxunicode, 0)], 1: [(0, 0x60, 0), (0x61, 0x7a, 1), (0x7b, maxunicode, 0)]},
+	)
+	both = cjk & lower
+	assert both.accepts("一a")
+	assert not both.accepts("一")
+	assert (cjk | lower).accepts("a")
+	assert (cjk - lower).accepts("一")
+	assert not (cjk - lower).accepts("一a")
+	assert cjk.everythingbut().accepts("a")
+	assert not cjk.everythingbut().accepts("一")
+	assert (cjk + lower).accepts("一a")
+	assert cjk.star().accepts("")
+	assert (cjk * 2).accepts("一一")
+	assert both.reversed().accepts("a一")
+	assert (both ^ cjk).accepts("一")
+	assert (cjk & cjk.everythingbut()).empty()
+	assert cjk == cjk.reduce()
+	assert cjk != lower
+
+	# Converting to and from ordinary FSMs
+	f = (a | b).to_symbolic()
+	assert f.accepts("a")
+	assert f.accepts("b")
+	assert not f.accepts("c")
+	assert fsm.from_symbolic(f) == a | b
+	assert fsm.from_symbolic(f).alphabet == {"a", "b", anything_else}
+
+	# States with no transitions at all, such as a final sink
+	sink = fsm.from_symbolic(sfa(states = {0, 1}, initial = 0, finals = {1}, map = {0: [(0x61, 0x61, 1)]}))
+	assert sink.accepts("a")
+	assert not sink.accepts("aa")
+	assert not sink.accepts("")
+	empty = fsm.from_symbolic(epsilon(set()).to_symbolic())
+	assert empty.accepts("")
+	assert not empty.accepts("a")
+
+	# Only the characters which behave unlike most of Unicode are needed
+	g = fsm.from_symbolic(both.everythingbut().reduce())
+	assert len(g.alphabet) == 0x9fff - 0x4e00 + 1 + 26 + 1
+	assert g.accepts("b")
+	assert not g.accepts("一z")
+	assert g.to_symbolic() == both.everythingbut()
+
+	# A narrower alphabet is fine as long as what's left out behaves the same
+	h = fsm.from_symbolic(lower, alphabet = set("abcdefghijklmnopqrstuvwxyz!") | {anything_else})
+	assert h.accepts("!a")
+	assert h.accepts("!z")
+	assert not h.accepts("a!")
+	with pytest.raises(Exception):
+		fsm.from_symbolic(cjk, alphabet = {"a", anything_else})
+	with pytest.raises(Exception):
+		fsm(alphabet = {"ab"}, states = {0}, initial = 0, finals = set(), map = {}).to_symbolic()
+
+def test_dense_product(a, b):
+	from greenery import fsm as module
+	dense = [fsm.from_dense(f.to_dense()) for f in (a, b.everythingbut())]
+	dense.append(fsm.from_dense(a.star().to_dense().compress()))
+	for method in [fsm.union, fsm.intersection, fsm.difference, fsm.symmetric_difference]:
+		product = method(*dense, reduce=False)
+		expected = method(a, b.everythingbut(), a.star(), reduce=False)
+		# States are numbered identically with or without NumPy
+		assert dict((state, dict(row)) for (state, row) in product.map.items()) == expected.map
+		assert product.finals == expected.finals
+		assert ("_table" in product.__dict__) == (module.np is not None)
+		assert method(*dense).map == expected.reduce().map
+
+def test_dense_product_deep(a, b, monkeypatch):
+	from greenery import fsm as module
+	# A product thousands of levels deep, with narrow levels and wide ones
+	n = 3000
+	chain = fsm(
+		alphabet = {"a", "b"},
+		states   = range(n + 1),
+		initial  = 0,
+		finals   = {n},
+		map      = dict((i, {"a": i + 1}) for i in range(n)),
+	)
+	wide = (a | b).star() + chain
+	expected = wide.intersection(chain, a.star(), reduce=False)
+	dense = [fsm.from_dense(f.to_dense()) for f in (wide, chain, a.star())]
+	for level in [1, 64, n]:
+		monkeypatch.setattr(module, "_dense_level", level)
+		product = fsm.intersection(*dense, reduce=False)
+		assert dict((state, dict(row)) for (state, row) in product.map.items()) == expected.map
+		assert product.finals == expected.finals
+
+def test_reduce_numpy(a, b):
+	# Identical results to Hopcroft's, with or without NumPy
+	for f in [a.union(b, reduce=False), (a + b).star(reduce=False), a.difference(a, reduce=False)]:
+		for g in [f, fsm.from_dense(f.to_dense()), fsm.from_dense(f.to_dense().compress())]:
+			reduced = g.reduce(method="numpy")
+			assert dict((state, dict(row)) for (state, row) in reduced.map.items()) == f.reduce().map
+			assert reduced.finals == f.reduce().finals
+			assert reduced.alphabet == f.alphabet
+			assert reduced.reduce() is reduced
+
+def test_crawlstore(a, b, tmp_path):
+	path = str(tmp_path / "crawl.sqlite")
+	expected = a.union(b.star(), reduce=False)
+
+	store = crawlstore(path)
+	product = a.union(b.star(), reduce=False, store=store)
+	assert "_table" in product.__dict__
+	assert dict((state, dict(row)) for (state, row) in product.map.items()) == expected.map
+	assert product.finals == expected.finals
+	assert product.alphabet == expected.alphabet
+	assert a.union(b.star(), store=store) == expected
+	with pytest.raises(Exception):
+		a.intersection(b, store=store)
+	store.close()
+
+	# Interrupt a crawl part way through, then resume it
+	(alphabet, initial, final, follow) = _doubling()
+	calls = []
+	def interrupted(state, symbol):
+		if len(calls) == 7:
+			raise KeyboardInterrupt
+		calls.append(state)
+		return follow(state, symbol)
+	store = crawlstore(str(tmp_path / "resume.sqlite"), checkpoint = 2)
+	with pytest.raises(KeyboardInterrupt):
+		crawl(alphabet, initial, final, interrupted, store = store)
+	store.close()
+
+	del calls[:]
+	store = crawlstore(str(tmp_path / "resume.sqlite"), checkpoint = 2)
+	def counted(state, symbol):
+		calls.append(state)
+		return follow(state, symbol)
+	resumed = crawl(alphabet, initial, final, counted, store = store)
+	# The states before the checkpoint weren't expanded again. (The initial
+	# state's transitions are followed to check that it's the same crawl.)
+	assert calls[:2] == [0, 0]
+	assert 0 not in calls[2:] and 1 not in calls
+	assert resumed.map == crawl(alphabet, initial, final, follow).map
+	store.close()
+
+def _doubling():
+	'''Count up to 8 in steps of 1 ("a") or 2 ("b"), for test_crawlstore()'''
+	def follow(state, symbol):
+		if state == 8:
+			raise OblivionError
+		return min(state + (1 if symbol == "a" else 2), 8)
+	return ({"a", "b"}, 0, lambda state: state == 8, follow)
+
+def test_parallel_crawl(a, b, monkeypatch):
+	from greenery import fsm as module
+	dense = fsm.from_dense(b.to_dense())
+	operations = [
+		lambda: a.union(b.everythingbut(), reduce = False),
+		lambda: a.intersection(dense.star(), reduce = False),
+		lambda: a.concatenate(b, a, reduce = False),
+		lambda: (a + b).star(reduce = False),
+		lambda: (a | b).times(3, reduce = False),
+		lambda: reversed(a.concatenate(b.star(), reduce = False)),
+	]
+	expected = [operation() for operation in operations]
+
+	# Hand out every level, however small, to the worker processes
+	monkeypatch.setattr(module, "_parallel_level", 1)
+	assert use_workers(2) == 1
+	try:
+		for (operation, serial) in zip(operations, expected):
+			result = operation()
+			assert result.map == serial.map
+			assert result.finals == serial.finals
+
+		# One pool serves every crawl, and the caller's `follow()` isn't kept
+		executor = module._executors[2]
+		assert operations[0]().map == expected[0].map
+		assert module._executors == {2: executor}
+		assert module._worker is None
+
+		# Monitors are called as often as by a serial crawl, not once per chunk
+		monkeypatch.setattr(module, "_check_interval", 3)
+		product = module._product([a.star(), (a + b).star(), b.everythingbut()], any)
+		counts = {}
+		for workers in [1, 2]:
+			events = []
+			with monitor(progress = lambda operation, **counts: events.append(counts)):
+				crawled = crawl(*product, workers = workers)
+			counts[workers] = len(events)
+		assert 0 < counts[2] <= counts[1] == -(-len(crawled.states) // 3)
+
+		# Parallel crawls can be cancelled, and the pool survives it
+		events = []
+		token = cancellation()
+		def progress(operation, **counts):
+			events.append(counts)
+			token.cancel()
+		with monitor(token, progress):
+			with pytest.raises(CancelledError):
+				a.union(b.everythingbut(), reduce = False)
+		assert len(events) == 1
+		assert operations[0]().map == expected[0].map
+
+		# The number of processes is local to each thread
+		import threading
+		counts = []
+		thread = threading.Thread(target = lambda: counts.append(use_workers(3)))
+		thread.start()
+		thread.join()
+		assert counts == [1]
+	finally:
+		assert use_workers(1) == 2
+
+	# Symbols survive the trip to a worker process and back
+	import pickle
+	assert pickle.loads(pickle.dumps(anything_else)) is anything_else
+
+def test_budget(a, b, tmp_path):
+	(alphabet, initial, final, follow) = _doubling()
+	assert len(crawl(alphabet, initial, final, follow, max_states = 9).states) == 9
+	with pytest.raises(BudgetError) as info:
+		crawl(alphabet, initial, final, follow, max_states = 5)
+	assert (info.value.max_states, info.value.states, info.value.expanded) == (5, 6, 3)
+
+	# Budgets nest, and only get tighter
+	with budget(5):
+		with budget(100):
+			with pytest.raises(BudgetError):
+				crawl(alphabet, initial, final, follow)
+		with pytest.raises(BudgetError):
+			crawl(alphabet, initial, final, follow, workers = 2)
+		with pytest.raises(BudgetError):
+			crawl(alphabet, initial, final, follow, store = crawlstore(str(tmp_path / "budget.sqlite")))
+	assert len(crawl(alphabet, initial, final, follow).states) == 9
+
+	# Stores which already hold more states than the budget allows
+	store = crawlstore(str(tmp_path / "budget.sqlite"), checkpoint = 1)
+	with pytest.raises(BudgetError):
+		crawl(alphabet, initial, final, follow, store = store, max_states = 7)
+	with pytest.raises(BudgetError) as info:
+		crawl(alphabet, initial, final, follow, store = store, max_states = 3)
+	assert (info.value.max_states, info.value.states) == (3, 7)
+	assert len(crawl(alphabet, initial, final, follow, store = store).states) == 9
+	with pytest.raises(BudgetError) as info:
+		crawl(alphabet, initial, final, follow, store = store, max_states = 5)
+	assert (info.value.max_states, info.value.states, info.value.expanded) == (5, 9, 9)
+	store.close()
+
+	# Every construction is covered
+	unit = a + b
+	with budget(3):
+		with pytest.raises(BudgetError):
+			unit * 5
+		with pytest.raises(BudgetError):
+			unit.union(b.star(), reduce = False)
+		with pytest.raises(BudgetError):
+			fsm.from_dense(unit.to_dense()) | fsm.from_dense(b.star().to_dense())
+		with pytest.raises(BudgetError):
+			(unit * 2).reduce(method = "brzozowski")
+	with pytest.raises(BudgetError):
+		(unit * 2).reversed(max_states = 3)
+	assert len((unit * 2).reversed(max_states = 100).states) > 3
+
+def test_monitor(a, b, monkeypatch):
+	from greenery import fsm as module
+	monkeypatch.setattr(module, "_check_interval", 2)
+	(alphabet, initial, final, follow) = _doubling()
+
+	events = []
+	with monitor(progress = lambda operation, **counts: events.append((operation, counts))):
+		crawl(alphabet, initial, final, follow)
+		(a + b).star(reduce = False).reduce()
+	assert events[:2] == [
+		("crawl", {"states": 1, "frontier": 1}),
+		("crawl", {"states": 4, "frontier": 2}),
+	]
+	assert any(operation == "reduce" for (operation, counts) in events)
+
+	# Expired deadlines and cancellations stop operations
+	with monitor(cancellation(timeout = 0)):
+		with pytest.raises(CancelledError):
+			crawl(alphabet, initial, final, follow)
+	token = cancellation()
+	assert not token.expired()
+	with monitor(token, lambda operation, **counts: token.cancel()):
+		with pytest.raises(CancelledError):
+			a.union(b, reduce = False)
+		with pytest.raises(CancelledError):
+			fsm.from_dense(a.to_dense()) | fsm.from_dense(b.to_dense())
+	assert token.expired()
+
+	# Outside the monitor, nothing is checked
+	assert len(crawl(alphabet, initial, final, follow).states) == 9
+
+def test_budget_threads():
+	# Budgets in concurrent threads don't leak into each other
+	import threading
+	(alphabet, initial, final, follow) = _doubling()
+	entered = threading.Barrier(2)
+	results = {}
+	def run(max_states):
+		with budget(max_states):
+			entered.wait()
+			try:
+				results[max_states] = len(crawl(alphabet, initial, final, follow).states)
+			except BudgetError:
+				results[max_states] = None
+			entered.wait()
+	threads = [threading.Thread(target = run, args = (n,)) for n in (5, 1000)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert results == {5: None, 1000: 9}
+	assert len(crawl(alphabet, initial, final, follow).states) == 9
+
+def test_monitor_threads():
+	# Cancelling in one thread doesn't cancel operations in another
+	import threading
+	(alphabet, initial, final, follow) = _doubling()
+	entered = threading.Barrier(2)
+	results = {}
+	def run(name, cancel):
+		with monitor(cancel):
+			entered.wait()
+			try:
+				results[name] = len(crawl(alphabet, initial, final, follow).states)
+			except CancelledError:
+				results[name] = None
+			entered.wait()
+	threads = [
+		threading.Thread(target = run, args = ("cancelled", cancellation(timeout = 0))),
+		threading.Thread(target = run, args = ("running", cancellation())),
+	]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert results == {"cancelled": None, "running": 9}
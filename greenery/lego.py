@@ -56,8 +56,9 @@ def call_fsm(method):
 	'''
 	fsm_method = getattr(fsm.fsm, method.__name__)
 	def new_method(*legos):
-		alphabet = set().union(*[lego.alphabet() for lego in legos])
-		return from_fsm(fsm_method(*[lego.to_fsm(alphabet) for lego in legos]))
+		symbols = classes(*legos)
+		alphabet = set(symbols.values())
+		return from_fsm(fsm_method(*[lego._to_fsm(alphabet) for lego in legos]), symbols)
 	return new_method
 
 def parse(string):
@@ -67,11 +68,56 @@ def parse(string):
 	'''
 	return pattern.parse(string)
 
-def from_fsm(f):
+def classes(*legos, alphabet=None):
+	'''
+		Partition `alphabet` (by default, every character used in these lego
+		pieces, plus `fsm.anything_else`) into classes of characters which every
+		charclass in them treats the same way, i.e. which belong to the same
+		charclasses. Return a dict mapping each character to a representative of
+		its class, the first in sorted order, as `fsm.compress_alphabet()` would.
+		FSMs built over only the representatives have much smaller alphabets.
+	'''
+	if alphabet is None:
+		alphabet = set().union(*[lego.alphabet() for lego in legos])
+
+	memberships = dict((char, set()) for char in alphabet)
+	for (i, c) in enumerate(set().union(*[lego.charclasses() for lego in legos])):
+		for char in c.chars:
+			if char in memberships:
+				memberships[char].add(i)
+
+	groups = {}
+	for char in sorted(memberships, key=fsm.key):
+		groups.setdefault(frozenset(memberships[char]), []).append(char)
+
+	result = {}
+	for members in groups.values():
+		for char in members:
+			result[char] = members[0]
+	return result
+
+def from_fsm(f, classes=None):
 	'''
 		Turn the supplied finite state machine into a `lego` object. This is
 		accomplished using the Brzozowski algebraic method.
+		If the FSM's alphabet was compressed, `classes` maps every character to
+		its representative in the alphabet (see `fsm.compress_alphabet()`).
+		Each representative then stands for its whole class.
 	'''
+	# Which charclass each symbol stands for. A symbol standing for
+	# `fsm.anything_else` stands for every character not otherwise mentioned.
+	if classes is None:
+		classes = dict((symbol, symbol) for symbol in f.alphabet)
+	members = {}
+	for (char, representative) in classes.items():
+		members.setdefault(representative, set()).add(char)
+	chars = set(classes) - {fsm.anything_else}
+	for (representative, member) in members.items():
+		if fsm.anything_else in member:
+			members[representative] = ~charclass(chars - member)
+		else:
+			members[representative] = charclass(member)
+
 	# Make sure the supplied alphabet is kosher. It must contain only single-
 	# character strings or `fsm.anything_else`.
 	for symbol in f.alphabet:
@@ -119,15 +165,13 @@ def from_fsm(f):
 	for a in f.map:
 		for symbol in f.map[a]:
 			b = f.map[a][symbol]
-			if symbol == fsm.anything_else:
-				brz[a][b] |= ~charclass(f.alphabet - {fsm.anything_else})
-			else:
-				brz[a][b] |= charclass({symbol})
+			brz[a][b] |= members[symbol]
 		if a in f.finals:
 			brz[a][outside] |= emptystring
 
 	# Now perform our back-substitution
 	for i in reversed(range(len(states))):
+		fsm.check_progress("from_fsm", len(states) - 1 - i, step=len(states) - i, steps=len(states))
 		a = states[i]
 
 		# Before the equation for R_a can be substituted into the other
@@ -195,7 +239,7 @@ class lego:
 		'''
 		raise Exception("This object is immutable.")
 
-	def to_fsm(self, alphabet):
+	def to_fsm(self, alphabet=None, reduce=True, max_states=None):
 		'''
 			Return the present lego piece in the form of a finite state machine,
 			as imported from the fsm module.
@@ -204,6 +248,27 @@ class lego:
 			mentioned in self. However, if we intend to connect this FSM to another
 			one which uses different characters, we may need to supply an alphabet
 			which is a superset of both sets.
+			The FSM is built over one representative of each class of characters
+			which the present lego piece can't tell apart (see `classes()`), then
+			expanded to the full alphabet. The FSMs of nested pieces are reduced
+			before they're combined, but the intermediate results of combining
+			them (e.g. the pairwise unions of a pattern) aren't. `reduce` only says
+			whether the final result is reduced too.
+			If `max_states` is given, then an `fsm.BudgetError` is raised as soon
+			as any FSM built along the way would have more states than that. See
+			`fsm.budget()`.
+		'''
+		if alphabet is None:
+			alphabet = self.alphabet()
+		symbols = classes(self, alphabet=alphabet)
+		with fsm.budget(max_states):
+			f = self._to_fsm(set(symbols.values()), reduce=reduce)
+		return f.expand_alphabet(symbols)
+
+	def _to_fsm(self, alphabet, reduce=True):
+		'''
+			Like `to_fsm()`, but build the FSM over exactly the supplied alphabet,
+			which must include a representative of every class of characters.
 		'''
 		raise Exception("Not implemented")
 
@@ -352,6 +417,13 @@ class lego:
 		'''
 		raise Exception("Not implemented")
 
+	def charclasses(self):
+		'''
+			Return the set of all charclasses used in this lego piece. These
+			determine which characters it can tell apart.
+		'''
+		raise Exception("Not implemented")
+
 	@call_fsm
 	def everythingbut(self):
 		'''
@@ -601,10 +673,7 @@ class charclass(lego):
 
 		return output
 
-	def to_fsm(self, alphabet=None):
-		if alphabet is None:
-			alphabet = self.alphabet()
-
+	def _to_fsm(self, alphabet, reduce=True):
 		# 0 is initial, 1 is final
 
 		# If negated, make a singular FSM accepting any other characters
@@ -613,10 +682,12 @@ class charclass(lego):
 				0: dict([(symbol, 1) for symbol in alphabet - self.chars]),
 			}
 
-		# If normal, make a singular FSM accepting only these characters
+		# If normal, make a singular FSM accepting only these characters. If
+		# `alphabet` only has a representative of each class of characters (see
+		# `classes()`), then only those representatives.
 		else:
 			map = {
-				0: dict([(symbol, 1) for symbol in self.chars]),
+				0: dict([(symbol, 1) for symbol in self.chars & alphabet]),
 			}
 
 		return fsm.fsm(
@@ -648,6 +719,9 @@ class charclass(lego):
 	def alphabet(self):
 		return {fsm.anything_else} | self.chars
 
+	def charclasses(self):
+		return {self}
+
 	def empty(self):
 		return len(self.chars) == 0 and self.negated == False
 
@@ -1230,6 +1304,9 @@ class mult(lego):
 	def alphabet(self):
 		return {fsm.anything_else} | self.multiplicand.alphabet()
 
+	def charclasses(self):
+		return self.multiplicand.charclasses()
+
 	def empty(self):
 		return self.multiplicand.empty() and self.multiplier.min > bound(0)
 
@@ -1314,32 +1391,20 @@ class mult(lego):
 
 		return output + suffix
 
-	def to_fsm(self, alphabet=None):
-		if alphabet is None:
-			alphabet = self.alphabet()
-
+	def _to_fsm(self, alphabet, reduce=True):
 		# worked example: (min, max) = (5, 7) or (5, inf)
 		# (mandatory, optional) = (5, 2) or (5, inf)
 
-		unit = self.multiplicand.to_fsm(alphabet)
+		unit = self.multiplicand._to_fsm(alphabet)
 		# accepts e.g. "ab"
 
-		# accepts "ababababab"
-		mandatory = unit * self.multiplier.mandatory.v
-
-		# unlimited additional copies
 		if self.multiplier.optional == inf:
-			optional = unit.star()
-			# accepts "(ab)*"
-
+			optional = None
 		else:
-			optional = fsm.epsilon(alphabet) | unit
-			# accepts "(ab)?"
-
-			optional *= self.multiplier.optional.v
-			# accepts "(ab)?(ab)?"
+			optional = self.multiplier.optional.v
 
-		return mandatory + optional
+		# accepts "ababababab(ab)?(ab)?" or "ababababab(ab)*"
+		return unit.repeat(self.multiplier.mandatory.v, optional, reduce=reduce)
 
 	@classmethod
 	def match(cls, string, i = 0):
@@ -1490,19 +1555,22 @@ class conc(lego):
 
 		return self
 
-	def to_fsm(self, alphabet=None):
-		if alphabet is None:
-			alphabet = self.alphabet()
-
-		# start with a component accepting only the empty string
-		fsm1 = fsm.epsilon(alphabet)
-		for m in self.mults:
-			fsm1 += m.to_fsm(alphabet)
-		return fsm1
+	def _to_fsm(self, alphabet, reduce=True):
+		# Concatenate all of the mults at once, in a single subset construction,
+		# rather than one at a time. A single mult needs no concatenating at all.
+		if len(self.mults) == 0:
+			return fsm.epsilon(alphabet)
+		if len(self.mults) == 1:
+			return self.mults[0]._to_fsm(alphabet, reduce=reduce)
+		fsms = [m._to_fsm(alphabet) for m in self.mults]
+		return fsm.fsm.concatenate(*fsms, reduce=reduce)
 
 	def alphabet(self):
 		return {fsm.anything_else}.union(*[m.alphabet() for m in self.mults])
 
+	def charclasses(self):
+		return set().union(*[m.charclasses() for m in self.mults])
+
 	def empty(self):
 		for m in self.mults:
 			if m.empty():
@@ -1653,6 +1721,9 @@ class pattern(lego):
 	def alphabet(self):
 		return {fsm.anything_else}.union(*[c.alphabet() for c in self.concs])
 
+	def charclasses(self):
+		return set().union(*[c.charclasses() for c in self.concs])
+
 	def empty(self):
 		for c in self.concs:
 			if not c.empty():
@@ -1660,12 +1731,13 @@ class pattern(lego):
 		return True
 
 	def intersection(self, other):
-		# A deceptively simple method for an astoundingly difficult operation
-		alphabet = self.alphabet() | other.alphabet()
-
-		# Which means that we can build finite state machines sharing that alphabet
-		combined = self.to_fsm(alphabet) & other.to_fsm(alphabet)
-		return from_fsm(combined)
+		# A deceptively simple method for an astoundingly difficult operation.
+		# Build finite state machines sharing an alphabet, or rather sharing one
+		# representative of each class of characters
+		symbols = classes(self, other)
+		alphabet = set(symbols.values())
+		combined = self._to_fsm(alphabet) & other._to_fsm(alphabet)
+		return from_fsm(combined, symbols)
 
 	def union(self, other):
 		# other must be a pattern too
@@ -1862,13 +1934,21 @@ class pattern(lego):
 			self.concs
 		)
 
-	def to_fsm(self, alphabet=None):
-		if alphabet is None:
-			alphabet = self.alphabet()
-
-		fsm1 = fsm.null(alphabet)
-		for c in self.concs:
-			fsm1 |= c.to_fsm(alphabet)
+	def _to_fsm(self, alphabet, reduce=True):
+		# Take unions pairwise, as a balanced tree, so that each conc's FSM only
+		# takes part in a logarithmic number of products.
+		fsms = [c._to_fsm(alphabet) for c in self.concs]
+		if len(fsms) == 0:
+			return fsm.null(alphabet)
+		while len(fsms) > 1:
+			pairs = [fsms[i:i + 2] for i in range(0, len(fsms), 2)]
+			fsms = [
+				fsm.fsm.union(*pair, reduce=False) if len(pair) == 2 else pair[0]
+				for pair in pairs
+			]
+		fsm1 = fsms[0]
+		if reduce:
+			fsm1 = fsm1.reduce()
 		return fsm1
 
 	def reversed(self):
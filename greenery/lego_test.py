@@ -3,6 +3,7 @@
 if __name__ == "__main__":
 	raise Exception("Test files can't be run directly. Use `python -m pytest greenery`")
 
+import pytest
 from greenery.lego import conc, mult, charclass, one, emptystring, star, plus, nothing, pattern, qm, d, multiplier, bound, w, s, W, D, S, dot, nomatch, inf, zero, parse, from_fsm
 from greenery import fsm
 
@@ -373,6 +374,32 @@ def test_fsm():
 	assert bad.accepts("11")
 	assert not bad.accepts("01")
 
+def test_fsm_deferred_reduce():
+	# Each piece combines its children without reducing, then reduces once
+	for regex in ["abc|def(ghi|jkl)", "(ab)*c?d{2,3}", "a[^a]"]:
+		eager = parse(regex).to_fsm()
+		deferred = parse(regex).to_fsm(reduce=False)
+		assert "_minimal" in eager.__dict__
+		assert deferred.reduce().map == eager.map
+	assert "_minimal" not in parse("abc|def(ghi|jkl)").to_fsm(reduce=False).__dict__
+
+def test_fsm_many_children():
+	# Wide patterns and long concs are combined in one go or as a balanced tree
+	words = ["".join(chr(ord("a") + int(digit)) for digit in str(n)) for n in range(100, 300)]
+	keywords = parse("|".join(words)).to_fsm()
+	for word in words:
+		assert keywords.accepts(word)
+	assert not keywords.accepts("aaa")
+	assert not keywords.accepts("dab")
+	assert not keywords.accepts("bab" + "a")
+	assert len(keywords.states) == 4
+
+	long = parse("a?b" * 100).to_fsm()
+	assert long.accepts("b" * 100)
+	assert long.accepts("ab" * 100)
+	assert not long.accepts("b" * 99)
+	assert len(long.states) == 201
+
 def test_odd_bug():
 	# Odd bug with ([bc]*c)?[ab]*
 	int5A = mult(charclass("bc"), star).to_fsm({"a", "b", "c", fsm.anything_else})
@@ -1291,3 +1318,51 @@ def test_bug_36_2():
 	assert etc2.accepts("/etc/something")
 	assert not etc1.isdisjoint(etc2)
 	assert not etc2.isdisjoint(etc1)
+
+def test_classes():
+	from greenery.lego import classes
+	symbols = classes(parse("[ab]c|[a-c]d"))
+	assert symbols == {
+		"a": "a", "b": "a", "c": "c", "d": "d",
+		fsm.anything_else: fsm.anything_else,
+	}
+	# Characters outside every charclass share a class with anything_else
+	symbols = classes(parse("a"), alphabet = {"a", "b", "c", fsm.anything_else})
+	assert symbols == {"a": "a", "b": "b", "c": "b", fsm.anything_else: "b"}
+	f = parse("a").to_fsm({"a", "b", "c", fsm.anything_else})
+	assert f.alphabet == {"a", "b", "c", fsm.anything_else}
+	assert f.accepts("a")
+	assert not f.accepts("b")
+	assert f.reduce() is f
+	assert str(from_fsm(f.compress_alphabet()[0], symbols)) == "a"
+	assert str(parse("[^a]b").everythingbut().everythingbut()) == "[^a]b"
+
+def test_to_fsm_budget():
+	with pytest.raises(fsm.BudgetError):
+		parse("(a|b)*a(a|b){25}").to_fsm(max_states = 1000)
+	with pytest.raises(fsm.BudgetError):
+		parse("a{100000}").to_fsm(max_states = 1000)
+	with fsm.budget(1000):
+		with pytest.raises(fsm.BudgetError):
+			parse("(a|b)*a(a|b){8}") & parse("(a|b)*b(a|b){8}")
+	assert parse("(a|b)*a(a|b){3}").to_fsm(max_states = 1000).accepts("abbb")
+
+def test_monitor(monkeypatch):
+	steps = []
+	def progress(operation, **counts):
+		if operation == "from_fsm":
+			steps.append((counts["step"], counts["steps"]))
+	with fsm.monitor(progress = progress):
+		assert str(from_fsm(parse("abc").to_fsm())) == "abc"
+	assert steps == [(1, 4)]
+
+	# Every `_check_interval` states eliminated
+	monkeypatch.setattr(fsm, "_check_interval", 2)
+	steps.clear()
+	with fsm.monitor(progress = progress):
+		assert str(from_fsm(parse("abc").to_fsm())) == "abc"
+	assert steps == [(1, 4), (3, 4)]
+
+	with fsm.monitor(fsm.cancellation(timeout = 0)):
+		with pytest.raises(fsm.CancelledError):
+			parse("a*b") & parse("ab*")
@@ -5,7 +5,9 @@ from greenery import __version__
 setup(
 	name = "greenery",
 	version = __version__,
+	python_requires = ">=3.7",
 	tests_require = [ "pytest" ],
+	extras_require = { "numpy": [ "numpy" ] },
 	packages = [ "greenery" ],
 	package_dir = { "greenery": "greenery" },
 	author = "qntm",
@@ -16,6 +18,8 @@ setup(
 	url = "https://github.com/qntm/greenery",
 	classifiers = [
 		"License :: OSI Approved :: MIT License",
-		"Programming Language :: Python :: 3.3",
+		"Programming Language :: Python :: 3",
+		"Programming Language :: Python :: 3 :: Only",
+		"Programming Language :: Python :: 3.7",
 	],
 )